@@ -8,13 +8,15 @@
 import sys
 
 # 3rd Party
+import numpy as np  # for burst reads
 try:
     import RPi.GPIO as gpio
+except ImportError:
+    import dummygpio as gpio
+try:
     import spidev as spi
-except:
-    debug = True
-else:
-    debug = False
+except ImportError:
+    import dummyspi as spi  # reads zero, unless a simulated rig is attached (see simhw.py)
 
 
 class MCP3008(object):
@@ -28,13 +30,16 @@ class MCP3008(object):
     **kwargs:
         cs_pin      (integer)       SPI chip select. Default is 1
         vref        (float)         ADC reference voltage. Default is 3.3
+        persistent  (bool)          Keep the SPI bus open between reads. Default is False
     '''
 
     bus = 0  # holds the bus connection
     cs_pin = 0  # which GPIO pin is used to talk to this chip? (gpio.BOARD numbering) OR which cs channel to use
     vref = 3.3  # Reference voltage in use
+    persistent = False  # if True, the bus is only closed by release()
+    bus_open = False  # is the bus currently open?
 
-    def __init__(self, cs_pin=1, vref=3.33):
+    def __init__(self, cs_pin=1, vref=3.33, persistent=False):
         ''' 
         object = adc.MCP3008(**kwargs)
         
@@ -43,9 +48,12 @@ class MCP3008(object):
         **kwargs:
             cs_pin      (integer)       SPI chip select. Default is 1
             vref        (float)         ADC reference voltage. Default is 3.3
+            persistent  (bool)          Keep the SPI bus open between reads, rather than opening and
+                                        closing it for every conversion. Call release() when finished.
+                                        Default is False
         '''
-        global debug
-        if debug: return
+        self.persistent = persistent
+        self.bus_open = False
         
         # Chip select setup
         self.cs_pin = cs_pin
@@ -76,14 +84,9 @@ class MCP3008(object):
         Returns: 
             data        (integer)       10-bit value representing the voltage level on the channel specified.
         '''
-        global debug
-        if debug: return 0
-        
         self.open()
         #indat = self.bus.xfer2([1, 8 + channel << 4, 0])
-        command = 0b11 << 6
-        command |= (channel & 0x07) << 3
-        indat = self.bus.xfer2([command, 0, 0])
+        indat = self.bus.xfer2(self.command(channel))
         self.close()
 
         number =  (indat[0] & 0x01) << 9
@@ -91,6 +94,71 @@ class MCP3008(object):
         number |= (indat[2] & 0x80) >> 7
 
         return number
+
+    def command(self, channel):
+        '''
+        command(channel)
+        
+        Builds the three byte SPI frame which starts a single-ended conversion on a channel.
+        
+        Parameters:
+            channel     (integer)       The ADC data channel to convert. Must be in range of 0 to 7 inclusive.
+        
+        Returns:
+            frame       ([byte] * 3)    Bytes to send to the ADC.
+        '''
+        command = 0b11 << 6
+        command |= (channel & 0x07) << 3
+        return [command, 0, 0]
+
+    def read_channels(self, channels, volts=True):
+        '''
+        read_channels(channels, **kwargs)
+        
+        Reads a number of channels in one burst: the bus is opened once, every conversion is
+        performed, and the results are decoded together.
+        
+        The MCP3008 only starts a new conversion after chip select is raised, so each conversion
+        is still its own transfer; the saving is in the open/close and decoding overhead.
+        
+        Parameters:
+            channels    (list, integer) The ADC data channels to be read from, in order. Each must be in
+                                        range of 0 to 7 inclusive.
+        
+        **kwargs:
+            volts       (bool)          Convert the readings to volts. Default is True
+        
+        Returns:
+            out         (numpy array)   10-bit values (or voltages, if volts is True) for each channel.
+        '''
+        self.open()
+        xfer2 = self.bus.xfer2
+        indat = np.array([xfer2(self.command(channel)) for channel in channels], np.int64)
+        self.close()
+        
+        if len(indat) == 0: indat = indat.reshape(0, 3)
+        
+        number =  (indat[:, 0] & 0x01) << 9
+        number |= (indat[:, 1] & 0xFF) << 1
+        number |= (indat[:, 2] & 0x80) >> 7
+        
+        if volts:
+            return number * (self.vref / 1023.0)
+        return number
+
+    def read_all_channels(self, volts=True):
+        '''
+        read_all_channels(**kwargs)
+        
+        Reads every channel of the ADC (CH0 to CH7) in one burst. See read_channels().
+        
+        **kwargs:
+            volts       (bool)          Convert the readings to volts. Default is True
+        
+        Returns:
+            out         (numpy array)   8 values, one for each channel.
+        '''
+        return self.read_channels(range(8), volts=volts)
         
     def read_volts(self, channel):
         '''
@@ -105,9 +173,6 @@ class MCP3008(object):
         Returns:
             volts       (float)         The voltage level on the channel specified.
         '''
-        global debug
-        if debug: return 0
-        
         dat = self.read_data(channel)
         volts = (float(dat) / 1023.0) * self.vref
         return volts
@@ -121,9 +186,6 @@ class MCP3008(object):
         Parameters:
             byte        (byte)          The 8 bit command to be sent to the ADC.
         '''
-        global debug
-        if debug: return
-        
         self.open()
         command = [byte, 0]  # Two bytes; first is command shifted 4 bits, second is zero
         self.bus.writebytes(command)
@@ -135,10 +197,9 @@ class MCP3008(object):
         
         Opens a channel to the SPI device.
         
-        Must completed by a following close() call.
+        Must completed by a following close() call. Does nothing if the bus is already open.
         '''
-        global debug
-        if debug: return
+        if self.bus_open: return
         
         if (self.cs_pin > 1):
             gpio.output(self.cs_pin, gpio.HIGH)
@@ -147,21 +208,34 @@ class MCP3008(object):
         else:
             self.bus.open(0, self.cs_pin)
             self.bus.max_speed_hz = int(1.35 * (10 ** 6))
+        self.bus_open = True
 
     def close(self):
         '''
         close()
         
         closes a (previously opened) channel to the SPI device.
+        
+        In persistent mode the bus is left open; use release() to close it.
+        '''
+        if self.persistent: return
+        
+        self.release()
+
+    def release(self):
+        '''
+        release()
+        
+        Closes the channel to the SPI device, even in persistent mode.
         '''
-        global debug
-        if debug: return
+        if not self.bus_open: return
         
         if (self.cs_pin > 1):
             gpio.output(self.cs_pin, gpio.LOW)
             self.bus.close()
         else:
             self.bus.close()
+        self.bus_open = False
         
 if __name__ == "__main__":
     print __doc__
@@ -0,0 +1,153 @@
+'''
+    Binary, fixed width log file format.
+
+    A log is a short self-describing header followed by fixed width little-endian records, one
+    per row. The header names each column and gives its type, so the records can be memory
+    mapped straight into numpy arrays (see dproc.read_binlog) without any parsing.
+
+    Layout:
+        magic       8 bytes         'RPIRBLOG'
+        length      uint32 (LE)     Length of the JSON header which follows
+        header      JSON            {"version": 1, "columns": [[name, dtype], ...]}
+        padding     spaces          Pads the header so that records start on an 8 byte boundary
+        records     ...             Packed rows
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import json
+import struct
+
+# 3rd Party
+import numpy as np  # for record dtypes
+
+magic = "RPIRBLOG"
+version = 1
+
+
+def make_dtype(columns):
+    '''
+    make_dtype(columns)
+
+    Creates the numpy record type for a list of columns.
+
+    Parameters:
+        columns     (list)          List of column names, or of (name, dtype) pairs. Columns given by name
+                                    alone are stored as float32, except for 't' which is stored as float64.
+
+    Returns:
+        dtype       (numpy dtype)   Packed, little-endian record type.
+    '''
+    fields = list()
+    for c in columns:
+        if isinstance(c, (tuple, list)):
+            name, dt = c
+        else:
+            name, dt = c, ("<f8" if c == "t" else "<f4")
+        fields.append((str(name), np.dtype(dt).newbyteorder("<")))
+    return np.dtype(fields)
+
+
+def is_binlog(path):
+    '''
+    is_binlog(path)
+
+    Checks whether a file is a binary log, by its magic bytes.
+    '''
+    with open(path, "rb") as f:
+        return f.read(len(magic)) == magic
+
+
+def read_header(path):
+    '''
+    read_header(path)
+
+    Reads the header of a binary log.
+
+    Parameters:
+        path        (string)        Path to the log file.
+
+    Returns:
+        dtype       (numpy dtype)   Record type of the log.
+        offset      (integer)       Byte offset at which the records begin.
+    '''
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise IOError("{} is not a binary log".format(path))
+        length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("ascii"))
+    offset = len(magic) + 4 + length
+    offset += (-offset) % 8
+    return make_dtype(header["columns"]), offset
+
+
+class binlog_writer(object):
+    '''
+    Usage:
+
+    object = binlog.binlog_writer(path, columns)
+
+    Creates a new binary log file at (path), and writes the header.
+
+    Parameters:
+        path        (string)        Path of the new log file.
+        columns     (list)          Column names, or (name, dtype) pairs. See make_dtype().
+    '''
+
+    def __init__(self, path, columns):
+        '''
+        object = binlog.binlog_writer(path, columns)
+
+        Creates a new binary log file at (path), and writes the header.
+
+        Parameters:
+            path        (string)        Path of the new log file.
+            columns     (list)          Column names, or (name, dtype) pairs. See make_dtype().
+        '''
+        self.path = path
+        self.dtype = make_dtype(columns)
+        self.columns = list(self.dtype.names)
+        self.packer = struct.Struct("<" + "".join(self.dtype.fields[n][0].char for n in self.columns))
+
+        header = json.dumps({"version": version,
+                             "columns": [[n, self.dtype.fields[n][0].str] for n in self.columns]})
+        length = len(header)
+        length += (-(len(magic) + 4 + length)) % 8
+
+        self.f = open(path, "wb")
+        self.f.write(magic)
+        self.f.write(struct.pack("<I", length))
+        self.f.write(header.ljust(length))
+
+    def write_row(self, row):
+        '''
+        binlog_writer.write_row(row)
+
+        Appends one record to the log.
+
+        Parameters:
+            row         (iterable)      One value per column, in column order.
+        '''
+        self.f.write(self.packer.pack(*row))
+
+    def write_rows(self, rows):
+        '''
+        binlog_writer.write_rows(rows)
+
+        Appends a number of records to the log in one write.
+
+        Parameters:
+            rows        (list)          List of rows, each with one value per column.
+        '''
+        if not len(rows): return
+        self.f.write(np.array([tuple(r) for r in rows], self.dtype).tostring())
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+if __name__ == "__main__":
+    print __doc__
@@ -0,0 +1,289 @@
+'''
+    Calibration store.
+
+    Keeps the rheometer's calibrations and geometry (etc/data.xml) in memory, typed, and with a
+    history of every previous value. The file is only parsed again when it changes on disk
+    (checked by modification time, size and inode), and is written atomically: to a temporary
+    file, which then replaces the original, so a crash mid-write can't leave it corrupt.
+
+    File format:
+        <data>
+            <icor value="0.018" />
+            <cal_IcoVms type="list" value="0.1,0.02" version="2" time="2017-11-28 13:58:00" />
+            <history>
+                <cal_IcoVms type="list" value="0.09,0.03" version="1" time="2017-10-09 09:40:00" />
+            </history>
+        </data>
+
+    Entries without a type are floats, and those without a version are version 0, so older
+    data files are read as they are.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import os
+import stat
+import time
+import tempfile
+import thread as td
+import xml.etree.ElementTree as ET
+
+# 3rd Party
+import numpy as np
+
+default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "etc", "data.xml")
+
+def parse_value(text, typ="float"):
+    '''
+    parse_value(text, **kwargs)
+
+    Converts the text of an entry to a value of type (typ): 'float', 'int', 'bool', 'str' or 'list' (of floats).
+    '''
+    if typ == "float": return float(text)
+    if typ == "int": return int(text)
+    if typ == "bool": return text.strip().lower() in ("1", "true", "yes")
+    if typ == "str": return text
+    if typ == "list": return [float(v) for v in text.split(",") if v.strip()]
+    raise ValueError("Unknown calibration type: {}".format(typ))
+
+def format_value(value):
+    '''
+    format_value(value)
+
+    Returns:
+        text        (string)        Text of the value, as stored in the file.
+        typ         (string)        Type of the value (see parse_value).
+    '''
+    if isinstance(value, (bool, np.bool_)): return str(bool(value)), "bool"
+    if isinstance(value, (int, long, np.integer)): return str(int(value)), "int"
+    if isinstance(value, (float, np.floating)): return repr(float(value)), "float"
+    if isinstance(value, basestring): return value, "str"
+    if isinstance(value, (list, tuple, np.ndarray)): return ",".join(repr(float(v)) for v in value), "list"
+    raise TypeError("Can't store a value of type {}".format(type(value).__name__))
+
+
+class cal_store(object):
+    '''
+    Usage:
+
+    object = calstore.cal_store(**kwargs)
+
+    Reads calibrations from file, and keeps them cached until the file changes.
+
+    **kwargs:
+        path        (string)        Path of the data file. Default is etc/data.xml, found relative to this
+                                    module (not the working directory).
+    '''
+
+    def __init__(self, path=default_path):
+        '''
+        object = calstore.cal_store(**kwargs)
+
+        Reads calibrations from file, and keeps them cached until the file changes.
+
+        **kwargs:
+            path        (string)        Path of the data file. Default is etc/data.xml, found relative to this
+                                        module (not the working directory).
+        '''
+        self.path = path
+        self.entries = dict()  # name: {"value", "type", "version", "time"}
+        self.history = dict()  # name: list of previous entries, oldest first
+        self.stamp = None  # (mtime, size, inode) of the file when last read
+        self.listeners = list()
+        self.lock = td.allocate_lock()
+        self.refresh()
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def refresh(self):
+        '''
+        cal_store.refresh()
+
+        Reads the file again if it has changed since it was last read.
+
+        Returns:
+            changed     (bool)          Whether the file was read.
+        '''
+        stamp = self.file_stamp()
+        if stamp == self.stamp: return False
+        with self.lock:
+            self.load()
+        self.notify()
+        return True
+
+    def load(self):
+        entries = dict()
+        history = dict()
+        if os.path.isfile(self.path):
+            self.stamp = self.file_stamp()
+            root = ET.parse(self.path).getroot()
+            for child in root:
+                if child.tag == "history":
+                    for old in child:
+                        history.setdefault(old.tag, list()).append(self.read_entry(old))
+                else:
+                    entries[child.tag] = self.read_entry(child)
+        for h in history.values():
+            h.sort(key=lambda e: e["version"])
+        self.entries = entries
+        self.history = history
+
+    def read_entry(self, element):
+        typ = element.get("type", "float")
+        return {"value": parse_value(element.get("value"), typ), "type": typ,
+                "version": int(element.get("version", 0)), "time": element.get("time", "")}
+
+    def add_listener(self, callback):
+        '''
+        cal_store.add_listener(callback)
+
+        Registers (callback) to be called, with the store as its only argument, whenever the calibrations
+        change (read from file or set). It is also called once straight away.
+        '''
+        self.listeners.append(callback)
+        callback(self)
+
+    def notify(self):
+        for callback in self.listeners:
+            callback(self)
+
+    def get(self, name, default=None):
+        '''
+        cal_store.get(name, **kwargs)
+
+        Gets the current value of a calibration, reading the file again first if it has changed.
+
+        **kwargs:
+            default     (any)           Returned if there is no such calibration. Default is None
+        '''
+        self.refresh()
+        entry = self.entries.get(name)
+        if entry is None: return default
+        return entry["value"]
+
+    def __getitem__(self, name):
+        self.refresh()
+        return self.entries[name]["value"]
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def as_dict(self):
+        '''
+        cal_store.as_dict()
+
+        Returns:
+            values      (dict)          name: current value, for every calibration.
+        '''
+        return dict((k, e["value"]) for k, e in self.entries.items())
+
+    def get_history(self, name):
+        '''
+        cal_store.get_history(name)
+
+        Returns:
+            history     (list)          (version, time, value) of every value the calibration has had, oldest
+                                        first and including the current value.
+        '''
+        self.refresh()
+        entries = self.history.get(name, list()) + ([self.entries[name]] if name in self.entries else list())
+        return [(e["version"], e["time"], e["value"]) for e in entries]
+
+    def set(self, name, value):
+        '''
+        cal_store.set(name, value)
+
+        Sets a calibration, and saves. The previous value is kept in the history.
+        '''
+        self.update({name: value})
+
+    def update(self, values):
+        '''
+        cal_store.update(values)
+
+        Sets a number of calibrations at once, then saves.
+
+        Parameters:
+            values      (dict)          name: new value.
+        '''
+        self.refresh()
+        with self.lock:
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            for name, value in values.items():
+                text, typ = format_value(value)
+                old = self.entries.get(name)
+                version = 1
+                if old is not None:
+                    self.history.setdefault(name, list()).append(old)
+                    version = old["version"] + 1
+                self.entries[name] = {"value": parse_value(text, typ), "type": typ, "version": version, "time": now}
+            self.save()
+        self.notify()
+
+    def make_element(self, name, entry):
+        text, typ = format_value(entry["value"])
+        attrib = {"value": text}
+        if typ != "float": attrib["type"] = typ
+        if entry["version"]: attrib["version"] = str(entry["version"])
+        if entry["time"]: attrib["time"] = entry["time"]
+        return ET.Element(name, attrib)
+
+    def save(self, path=None):
+        '''
+        cal_store.save(**kwargs)
+
+        Writes the calibrations, and their history, to file atomically.
+
+        **kwargs:
+            path        (string)        Path to write to. Default is the store's path.
+        '''
+        if path is None: path = self.path
+        root = ET.Element("data")
+        root.text = "\n    "
+        for name in sorted(self.entries):
+            root.append(self.make_element(name, self.entries[name]))
+        if self.history:
+            hist = ET.Element("history")
+            hist.text = "\n        "
+            for name in sorted(self.history):
+                for entry in self.history[name]:
+                    el = self.make_element(name, entry)
+                    el.tail = "\n        "
+                    hist.append(el)
+            el.tail = "\n    "
+            root.append(hist)
+        for el in root:
+            el.tail = "\n    "
+        if len(root): root[-1].tail = "\n"
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".data.", suffix=".xml", dir=dirname)
+        try:
+            with os.fdopen(fd, "w") as f:
+                ET.ElementTree(root).write(f)
+                f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp makes the file owner-only: keep the permissions of the file being replaced
+            mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+            os.chmod(tmp_path, mode)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # windows won't rename over an existing file
+                os.remove(path)
+                os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        if path == self.path: self.stamp = self.file_stamp()
+
+if __name__ == "__main__":
+    print __doc__
+    print cal_store.__doc__
@@ -1,7 +1,7 @@
 '''
-    Simple PI control in python.
+    Discrete-time PID control in python.
 
-    Author: Caner Durmusoglu (bilgi@ivmech.com)
+    Originally simple PI control by Caner Durmusoglu (bilgi@ivmech.com)
     Adapted by: Chris Boyle (christopher.boyle.101@strath.ac.uk)
 '''
 
@@ -9,94 +9,259 @@
 from time import time
 from time import sleep
 
+# 3rd Party
+import numpy as np  # for batch simulation
+
 class pid_controller(object):
     '''
-    Usage: 
+    Usage:
+
+    object = pid_controller(tuning, set_point, **kwargs)
 
-    object = pid_controller(tuning, set_point)
+    Creates an instance of a PID controller.
 
-    Creates an instance of a PI controller.
+    The derivative is low-pass filtered, the output is clamped to [out_min, out_max] and integral windup
+    is prevented by back-calculation: while the output is clamped, the integral is driven back towards
+    the value that would just reach the limit.
 
     Parameters:
-        tuning              (float, float)      Represents the gain parameters Kc and Kc/Ti respectively
-        set_point           (float)             Represents the desired output from the process. Default is 0
+        tuning              (float, float, float)   Gain parameters Kp, Ki and Kd respectively
+        set_point           (float)                 Represents the desired output from the process. Default is 0
     '''
-    
-    def __init__(self, tuning, set_point=0.0):
+
+    def __init__(self, tuning, set_point=0.0, out_min=0.0, out_max=100.0, deriv_filter=10.0, sp_weights=(1.0, 0.0), aw_gain=None):
         '''
-        object = pid_controller(tuning, set_point)
+        object = pid_controller(tuning, set_point, **kwargs)
+
+        Creates an instance of a PID controller.
 
-        Creates an instance of a PI controller.
-        
         Parameters:
-            tuning              (float, float)  Represents the gain parameters Kc and Kc/Ti respectively
-            set_point           (float)         Represents the desired output from the process. Default is 0
-            sample_time         (float)         Time between iterations in seconds. Default is 0.1
+            tuning              (float, float, float)   Gain parameters Kp, Ki and Kd respectively
+            set_point           (float)                 Represents the desired output from the process. Default is 0
+
+        **kwargs:
+            out_min             (float)                 Lower limit of the control action. Default is 0
+            out_max             (float)                 Upper limit of the control action. Default is 100
+            deriv_filter        (float)                 Derivative filter constant N: the derivative is filtered with
+                                                        time constant Kd / (Kp * N). Default is 10
+            sp_weights          (float, float)          Set point weights (b, c) for the proportional and derivative
+                                                        terms. Default is (1, 0): no derivative kick on set point changes
+            aw_gain             (float)                 Anti-windup back-calculation gain (1/s). Default is 1/Tt with
+                                                        Tt = sqrt(Ti * Td), or Ti if there is no derivative action
         '''
-        self.tuning = tuning 
-        self.set_point = set_point
-        
-        self.int_err = 0.0
-        self.windeup_guard = 20.0
-        
-        self.lov = 0.0
-        
+        self._tuning = tuning
+        self.out_min = out_min
+        self.out_max = out_max
+        self._deriv_filter = deriv_filter
+        self.sp_weights = sp_weights
+        self._aw_gain = aw_gain
+        self.update_gains()
+
         self.clear()
-    
+        self.set_point = set_point
+
     def clear(self):
         '''
         pid_controller.clear()
-        
+
         Resets stored variables to default/zero.
         '''
-        
+
         self.set_point      = 0.0
         self.pterm          = 0.0
         self.iterm          = 0.0
         self.dterm          = 0.0
         self.lerr           = 0.0
-        self.int_err        = 0.0
-        self.windup_guard   = 20.0
+        self.lderr          = None
         self.lov            = 0.0
         self.last_time      = time()
-    
-    def get_control_action(self, value):
+
+    # The gains used by get_control_action are worked out (by gains()) when tuning, deriv_filter or aw_gain is
+    # set, rather than on every call. Set the tuning as a whole: changes made to it in place aren't seen.
+    @property
+    def tuning(self):
+        return self._tuning
+
+    @tuning.setter
+    def tuning(self, tuning):
+        self._tuning = tuning
+        self.update_gains()
+
+    @property
+    def deriv_filter(self):
+        return self._deriv_filter
+
+    @deriv_filter.setter
+    def deriv_filter(self, deriv_filter):
+        self._deriv_filter = deriv_filter
+        self.update_gains()
+
+    @property
+    def aw_gain(self):
+        return self._aw_gain
+
+    @aw_gain.setter
+    def aw_gain(self, aw_gain):
+        self._aw_gain = aw_gain
+        self.update_gains()
+
+    def update_gains(self):
+        self.current_gains = tuple(float(g) for g in self.gains())
+
+    def gains(self, tuning=None):
+        '''
+        pid_controller.gains(**kwargs)
+
+        Calculates the gains, derivative filter time constant and anti-windup gain for a tuning. Works on arrays
+        of tunings as well as single values.
+
+        **kwargs:
+            tuning              (array)         Tuning(s) (Kp, Ki, Kd), shape (3,) or (n, 3). Default is the
+                                                controller's tuning.
+
+        Returns:
+            Kp, Ki, Kd, Tf, Kaw
+        '''
+        if tuning is None: tuning = self.tuning
+        g = np.asarray(tuning, np.float64)
+        Kp, Ki, Kd = g[..., 0], g[..., 1], g[..., 2]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Tf = np.where((Kp > 0) & (Kd > 0), Kd / (Kp * self.deriv_filter), 0.0)
+            if self.aw_gain is not None:
+                Kaw = self.aw_gain + np.zeros(Kp.shape)
+            else:
+                Ti = Kp / Ki
+                Td = Kd / Kp
+                Tt = np.where(Td > 0, np.sqrt(Ti * Td), Ti)
+                Kaw = np.where((Ki > 0) & (Kp > 0), 1.0 / Tt, 0.0)
+        return Kp[()], Ki[()], Kd[()], Tf[()], Kaw[()]
+
+    def get_control_action(self, value, dt=None):
         '''
         pid_controller.get_control_action(value)
-        
-        Calculates the next control action to keep the process output 
+
+        Calculates the next control action to keep the process output
         at the setpoint.
-        
+
         Parameters:
             value               (float)         Value of the controlled process output.
-        
+
+        **kwargs:
+            dt                  (float)         Time since the last call (s). Default is the measured time.
+
         Returns:
-            lov                 (float)         Value of control action/output: "last output value"
+            lov                 (float)         Value of control action/output, within [out_min, out_max]: "last output value"
         '''
+        Kp, Ki, Kd, Tf, Kaw = self.current_gains
+        b, c = self.sp_weights
+
         err = self.set_point - value
-        
+        derr = (c * self.set_point) - value
+        if self.lderr is None: self.lderr = derr
+
         self.current_time = time()
-        dt = self.current_time - self.last_time
-        derr = err - self.lerr
-        
-        self.pterm = self.tuning[0] * err
-        self.iterm += err * dt
-        
-        if (self.iterm < -self.windup_guard):
-            self.iterm = -self.windup_guard
-        elif (self.iterm > self.windup_guard):
-            self.iterm = self.windup_guard
-        
-        self.dterm = 0.0
-        if dt > 0: self.dterm = derr / dt
-        
+        if dt is None: dt = self.current_time - self.last_time
         self.last_time = self.current_time
+
+        self.pterm = Kp * ((b * self.set_point) - value)
+        if (Tf + dt) > 0:
+            self.dterm = (Tf * self.dterm + Kd * (derr - self.lderr)) / (Tf + dt)
+
+        out = self.pterm + self.iterm + self.dterm
+        self.lov = min(max(out, self.out_min), self.out_max)
+
+        # integrate, with back-calculation while the output is clamped
+        self.iterm += ((Ki * err) + (Kaw * (self.lov - out))) * dt
+
         self.lerr = err
-        
-        self.lov = self.pterm + (self.tuning[1] * self.iterm) + (self.tuning[2] * self.dterm)
-        
+        self.lderr = derr
+
         return self.lov
 
+    def simulate(self, plant, setpoints, dt, tunings=None):
+        '''
+        pid_controller.simulate(plant, setpoints, dt, **kwargs)
+
+        Simulates closed loop control of a plant model, for many tunings at once. Each time step is evaluated
+        for every tuning together.
+
+        Parameters:
+            plant               (object)        Plant model, with methods reset(n) (returns the initial outputs for
+                                                n simulations) and step(u, dt) (applies control actions u for dt
+                                                seconds and returns the new outputs). See first_order_plant.
+            setpoints           (array)         Set point at each time step.
+            dt                  (float)         Time step (s).
+
+        **kwargs:
+            tunings             (array)         Tunings (Kp, Ki, Kd) to simulate, shape (n, 3). Default is the
+                                                controller's tuning.
+
+        Returns:
+            y                   (array)         Process output at each time step, shape (n, len(setpoints)).
+            u                   (array)         Control action at each time step, shape (n, len(setpoints)).
+        '''
+        if tunings is None: tunings = [self.tuning]
+        tunings = np.atleast_2d(np.asarray(tunings, np.float64))
+        Kp, Ki, Kd, Tf, Kaw = self.gains(tunings)
+        b, c = self.sp_weights
+        setpoints = np.asarray(setpoints, np.float64)
+        n, N = len(tunings), len(setpoints)
+
+        ys = np.zeros((n, N))
+        us = np.zeros((n, N))
+        I = np.zeros(n)
+        D = np.zeros(n)
+        y = plant.reset(n) + np.zeros(n)
+        lderr = (c * setpoints[0]) - y
+        fd = Tf / (Tf + dt)
+        kd = Kd / (Tf + dt)
+
+        for k in range(N):
+            sp = setpoints[k]
+            err = sp - y
+            derr = (c * sp) - y
+            D = fd * D + kd * (derr - lderr)
+            out = Kp * ((b * sp) - y) + I + D
+            u = np.clip(out, self.out_min, self.out_max)
+            I += ((Ki * err) + (Kaw * (u - out))) * dt
+            lderr = derr
+
+            ys[:, k] = y
+            us[:, k] = u
+            y = plant.step(u, dt)
+        return ys, us
+
+class first_order_plant(object):
+    '''
+    Usage:
+
+    object = first_order_plant(gain, tau, **kwargs)
+
+    A first order process model (y' = (gain * u - y) / tau), for use with pid_controller.simulate.
+
+    Parameters:
+        gain                (float)         Steady state gain.
+        tau                 (float)         Time constant (s).
+
+    **kwargs:
+        y0                  (float)         Initial output. Default is 0
+    '''
+
+    def __init__(self, gain, tau, y0=0.0):
+        self.gain = gain
+        self.tau = tau
+        self.y0 = y0
+
+    def reset(self, n):
+        self.y = np.zeros(n) + self.y0
+        return self.y
+
+    def step(self, u, dt):
+        a = np.exp(-dt / self.tau)
+        self.y = a * self.y + (1.0 - a) * self.gain * u
+        return self.y
+
 if __name__ == "__main__":
     print __doc__
-    print tf_pi_controller.__doc__
+    print pid_controller.__doc__
@@ -12,64 +12,68 @@ for example)
 '''
 
 # System
+import os
 import math
 from copy import copy
+from collections import OrderedDict
 
 # 3rd Party
-import xml.etree.ElementTree as ET
 import numpy as np
 from numpy import *
-from scipy.optimize import curve_fit
-try:
-    import spidev # will error if not on rpi
-    from matplotlib import use as mpluse
-    mpluse('Agg')  # for plotting from commandline (with no xserver or anything)
-except:
-    pass # not on rpi, don't need to use (!xserver) as gui backend
-import matplotlib.pyplot as plt
-import pandas as pd
+# pandas, matplotlib and scipy (via filter) are slow to import, and aren't needed for control (geometry,
+# strain etc), so they are imported by the functions that use them.
 
 # RPi-R
-from filter import filter
+import binlog
+from calstore import cal_store
 
-######################################################################################################################## XML FUNCTIONS
-def writeout(path="./../etc/data.xml"):
+def pyplot():
+    '''
+    pyplot()
+    
+    Imports and returns matplotlib.pyplot. On the Pi, the Agg backend is used for plotting from the command
+    line (no X server).
+    '''
+    import matplotlib
+    try:
+        import spidev # will error if not on rpi
+        matplotlib.use('Agg')
+    except:
+        pass # not on rpi, don't need to use (!xserver) as gui backend
+    import matplotlib.pyplot as plt
+    return plt
+
+######################################################################################################################## CALIBRATIONS
+def writeout(path=None):
     '''
     writeout(**kwargs)
     
-    Writes the contents of a data file.
+    Writes the calibrations to file. Calibrations are normally saved as they are set (cal.set(name, value)), so
+    this is only needed to write a copy elsewhere.
     
     **kwargs:
-        path        (string)        Path to data.xml. Default is './../etc/data.xml'
+        path        (string)        Path to write to. Default is etc/data.xml
     '''
-    nuroot = ET.Element("all-data")
-    # update xml tree
-    
-    # for every k/v pair in data, add node to xml
-    for k, v in data.iteritems():
-        nuroot.insert(1, ET.Element(k, {"value":str(v)}))
-
-    #nuroot.write(path)
-    tree = ET.ElementTree(nuroot)
-    tree.write(path)
+    cal.save(path)
 
 def readin():
-    global root
-    root = ET.parse('./../etc/data.xml').getroot()
-    #root = ET.parse('./test.xml').getroot()
-
-    data = dict()
+    '''
+    readin()
     
-    for child in root:
-        data[child.tag] = float(child.attrib["value"])
-
-    return data
+    Gets the current calibrations, reading etc/data.xml again only if it has changed.
+    
+    Returns:
+        data        (dict)          Name: value of every calibration.
+    '''
+    cal.refresh()
+    return cal.as_dict()
 
-root = ""
-data = readin()
+cal = cal_store()
+data = cal.as_dict()
 
 ######################################################################################################################## GLOBALS/runtime
 vmsmult = 4.0 # due to voltage divider taking motor supply voltage down to a level the ADC can read
+spd_pad = 3.14 # logged in place of speeds from encoder channels that aren't in use
 
 # Noload/maxeff/stall values taken from datasheet: https://www.neuhold-elektronik.at/datenblatt/N7029.pdf
 ## NO LOAD
@@ -97,14 +101,173 @@ kv_noload = Vms_noload_V / omega_noload_rads
 kv_stall = (T_stall_Nm * R) / Vms_stall_V
 kv = np.average([kv_noload, kv_stall])
 
-## Get mass of inner cylinder
+## Geometry
 rho_nylon = 1150.0 # kg/m3
-m_cyl_b = rho_nylon * (data['icor'] ** 2) * data['ich']
 m_cyl_t = rho_nylon * 2 * (0.01 ** 3)
-m_cyl = m_cyl_b + m_cyl_t
+
+class couette_cell(object):
+    '''
+    Usage:
+    
+    object = dproc.couette_cell(icor, ocir)
+    
+    The constants of a couette cell, calculated once, for converting between the motion of the inner 
+    cylinder and the strain rate and stress in the fluid. The methods work on floats or arrays.
+    
+    Parameters:
+        icor        (float)         Outer radius of the inner cylinder (m).
+        ocir        (float)         Inner radius of the outer cylinder (m).
+    '''
+    
+    def __init__(self, icor, ocir):
+        self.icor = icor
+        self.ocir = ocir
+        self.strain_factor = icor / (ocir - icor) # strain rate per rad/s
+        self.A_small_m2 = pi * (icor ** 2)
+        self.A_big_m2 = pi * (ocir ** 2)
+        self.A_annulus_m2 = self.A_big_m2 - self.A_small_m2
+        # stress = torque / (2 * A_small * height), height = fill volume / A_annulus
+        self.stress_factor = self.A_annulus_m2 / (2.0 * self.A_small_m2 * 1e-6) # Pa per (Nm/ml)
+    
+    def strain(self, omega_rads):
+        '''
+        couette_cell.strain(omega_rads)
+        
+        Strain rate (1/s) in the fluid for an angular speed (rad/s) of the inner cylinder.
+        '''
+        return omega_rads * self.strain_factor
+    
+    def omega_for_strain(self, gamma_dot):
+        '''
+        couette_cell.omega_for_strain(gamma_dot)
+        
+        Angular speed (rad/s) of the inner cylinder which gives a strain rate (1/s).
+        '''
+        return gamma_dot / self.strain_factor
+    
+    def stress(self, torque_Nm, fill_volume_ml):
+        '''
+        couette_cell.stress(torque_Nm, fill_volume_ml)
+        
+        Stress (Pa) in the fluid for a torque (Nm) on the inner cylinder, and a fill volume (ml).
+        '''
+        return torque_Nm * (self.stress_factor / fill_volume_ml)
+    
+    def torque(self, stress_Pa, fill_volume_ml):
+        '''
+        couette_cell.torque(stress_Pa, fill_volume_ml)
+        
+        Torque (Nm) on the inner cylinder which gives a stress (Pa), for a fill volume (ml).
+        '''
+        return stress_Pa * (fill_volume_ml / self.stress_factor)
+
+def update_geometry(store):
+    '''
+    update_geometry(store)
+    
+    Recalculates the constants derived from the cell geometry. Called whenever the calibrations change,
+    rather than on every get_strain/get_stress.
+    '''
+    global data, m_cyl_b, m_cyl, I_cyl, cell
+    data = store.as_dict()
+    
+    # mass of inner cylinder
+    m_cyl_b = rho_nylon * (data['icor'] ** 2) * data['ich']
+    m_cyl = m_cyl_b + m_cyl_t
+    I_cyl = m_cyl * 0.5 * (data['icor'] ** 2) # moment of inertia of inner cylinder
+    
+    cell = couette_cell(data["icor"], data["ocir"])
+
+cal.add_listener(update_geometry)
 
 
 ######################################################################################################################## VISCOSITY CALCULATION STUFF
+class lru_cache(object):
+    '''
+    Usage:
+    
+    object = dproc.lru_cache(**kwargs)
+    
+    A small least-recently-used cache: once full, adding an entry evicts the entry which was used 
+    longest ago.
+    
+    **kwargs:
+        maxsize     (integer)           Maximum number of entries. Default is 1024
+    '''
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        '''Returns the value stored for key (marking it as recently used), or None.'''
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+    
+    def put(self, key, value):
+        '''Stores value for key, evicting the least recently used entry if full.'''
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        self.entries.clear()
+
+def mu_glycerol(T_c, misc_data=None):
+    '''Viscosity of glycerol (Pa.s) at T_c (celsius). Function is taken from [Cheng 2008].'''
+    return ((12100.0 * np.exp(((-1232.0 + T_c) * T_c) / (9900.0 + (70.0 * T_c)))) * 0.001)
+
+def mu_water(T_c, misc_data=None):
+    '''Viscosity of water (Pa.s) at T_c (celsius). Function is taken from [Cheng 2008].'''
+    return ((1.79 * np.exp(((-1230.0 - T_c) * T_c) / (36100.0 + (360.0 * T_c)))) * 0.001)
+
+def mu_glycerol_water(T_c, misc_data):
+    '''
+    Viscosity of aqueous glycerol solution (Pa.s) at T_c (celsius), where misc_data is the mass 
+    fraction of glycerol. Method is taken from [Cheng 2008].
+    '''
+    a = (0.705 - 0.0017 * T_c)
+    b = ((4.9 + 0.036 * T_c) * (a ** 0.25))
+    cm = np.asarray(misc_data, np.float64)
+    alpha = (1.0 - cm + ((a * b * cm * (1.0 - cm)) / ((a * cm) + (b * (1.0 - cm)))))
+    return (mu_water(T_c) ** alpha) * (mu_glycerol(T_c) ** (1.0 - alpha))
+
+viscosity_models = {
+    
+    "glycerol":mu_glycerol,
+    
+    "water":mu_water,
+    
+    "glycerol+water":mu_glycerol_water
+    
+    }
+
+mu_cache = lru_cache(maxsize=1024)
+
+def register_viscosity_model(material_n, model):
+    '''
+    register_viscosity_model(material_n, model)
+    
+    Adds (or replaces) a material for get_mu_of_T.
+    
+    Parameters:
+        material_n      (string)            The name of the material.
+        model           (function)          Called as model(T_c, misc_data), where T_c is a numpy array of 
+                                            temperatures in celsius. Must return the viscosity (Pa.s) as an
+                                            array of the same shape.
+    '''
+    viscosity_models[material_n] = model
+    mu_cache.clear()
+
 def get_mu_of_T(material_n, T_c, misc_data=None):
     '''
     get_mu_of_T(material_n, T_c, misc_data=None
@@ -112,6 +275,9 @@ def get_mu_of_T(material_n, T_c, misc_data=None):
     Uses functions from various data sources in order to calculate continuously
     the viscosity data of various compounds and mixtures from the current temperature.
     
+    The models are looked up in viscosity_models, and take whole arrays of temperatures (and 
+    compositions) at once. Results for single temperatures are cached.
+    
     Parameters
     ----------
     
@@ -123,14 +289,15 @@ def get_mu_of_T(material_n, T_c, misc_data=None):
     T_c             (float/iterable)    The temperature(s) in celsius used to calculate the
                                         viscosity of the material.
     
-    misc_data       (float/string)      For mixtures, there is often required to be extra information
+    misc_data       (float/string/iterable)
+                                        For mixtures, there is often required to be extra information
                                         to calculate the viscosity - such as the composition.
                                         This can be set here depending on the function requirements.
     
     Returns
     -------
     
-    mu_out          (float)             The viscosity of the specified material/mixture
+    mu_out          (float/array)       The viscosity of the specified material/mixture
     
     References
     ----------
@@ -138,52 +305,19 @@ def get_mu_of_T(material_n, T_c, misc_data=None):
     [Cheng 2008]    "Formula for the Viscosity of a Glycerol-Water Mixture",
                     Nian-Sheng Cheng, Ind. Eng. Chem. Res. 2008, 47, 3285-3288
     '''
-    
-    materials_dict = {
-    
-        "glycerol":0,
-        
-        "water":1,
-        
-        "glycerol+water":2
-        
-        }
-    
-    function_index = 0
-    
     try:
-        function_index = materials_dict[material_n]
+        model = viscosity_models[material_n]
     except:
         raise Exception("Material not known! Did you spell it correctly?")
     
-    # Alternative T units
-    T_K = T_c + 273.15                  # Tabs, Kelvin
-    T_F = T_c * (9.0/5.0) + 32.0        # Trel, Fahrenheit
-    T_R = T_F + 459.67                  # Tabs, Rankine
-    
-    mu_out = 0.0
-    
-    if function_index == 0:
-        # Material is glycerol
-        #
-        # Function is taken from [Cheng 2008]
-        mu_out = ((12100.0 * (e ** (((-1232.0 + T_c) * T_c) / (9900.0 + (70.0 * T_c))))) * 0.001)
-    elif function_index == 1:
-        # Material is water
-        #
-        # Function is taken from [Cheng 2008]
-        mu_out = ((1.79 * (e ** (((-1230.0 - T_c) * T_c) / (36100.0 + (360.0 * T_c))))) * 0.001)
-    elif function_index == 2:
-        # Material is aqueous glycerol solution
-        #
-        # Method is taken from [Cheng 2008]
-        a = (0.705 - 0.0017 * T_c)
-        b = ((4.9 + 0.036 * T_c) * (a ** 0.25))
-        mug = ((12100.0 * (e ** (((-1232.0 + T_c) * T_c) / (9900.0 + (70.0 * T_c))))) * 0.001)
-        muw = ((1.79 * (e ** (((-1230.0 - T_c) * T_c) / (36100.0 + (360.0 * T_c))))) * 0.001)
-        cm = float(misc_data)
-        alpha = (1.0 - cm + ((a * b * cm * (1.0 - cm)) / ((a * cm) + (b * (1.0 - cm)))))
-        mu_out = (muw ** alpha) * (mug ** (1.0 - alpha))
+    if np.ndim(T_c) != 0 or np.ndim(misc_data) != 0:
+        return model(np.asarray(T_c, np.float64), misc_data)
+    
+    key = (material_n, float(T_c), misc_data)
+    mu_out = mu_cache.get(key)
+    if mu_out is None:
+        mu_out = float(model(np.float64(T_c), misc_data))
+        mu_cache.put(key, mu_out)
     return mu_out
 
 def get_current(cv):
@@ -195,54 +329,68 @@ def get_strain(omega_rads):
     get_strain(omega_rads)
 
     Using the couette cell geometry, converts the angular speed of the inner cylinder to
-    the strain experienced by the fluid.
+    the strain experienced by the fluid. See couette_cell.strain.
     '''
-    strain_invs = omega_rads * (data["icor"] / (data["ocir"] - data["icor"])) 
-    return strain_invs
+    return cell.strain(omega_rads)
 
 def get_stress(torque_Nm, fill_volume_ml):
     '''
     get_stress(torque_Nm, fill_volume_ml)
     
     Given the torque and the fill volume, calculates the 
-    corresponding stress experienced by the fluid.
-    '''
-    A_small_m2 = (pi * (data["icor"] ** 2)) # in m^2
-    A_big_m2   = (pi * (data["ocir"] ** 2)) # in m^2
-    A_middle_m2 = A_big_m2 - A_small_m2 # Calculating the annular area
-    fill_volume_m3 = fill_volume_ml * (10.0 ** (-6.0))
-    height_m = fill_volume_m3 / A_middle_m2
-    stress_pa = torque_Nm / (2 * A_small_m2 * height_m)
-    return stress_pa
-
-def calc_mu(st, Vms_V, Ims_A, fill_volume_m3, omega_rads, dwdt_override=None):
-    gamma_dot = get_strain(omega_rads)
-    a = 1
-    tau = 0
-    T = 0
-    try:
-        a = len(st)
-        domegadt = [0]
-        for i in range(1, a):
-            domegadt.append((omega_rads[i] - omega_rads[i - 1]) / (st[i] - st[i - 1]))
-        
-        domegadt = np.array(domegadt, np.float64)
-            
-        T = list()
-        for i in range(a):
-            T.append(kv * Ims_A[i] - (m_cyl * 0.5 * (icor ** 2) * domegadt[i]))
-         
-        T = np.array(T, np.float64)
-    except TypeError:
-        if dwdt_override:
-            domegadt = dwdt_override
-        else:
-            domegadt = 0
-            
-        T = kv * Ims_A - (m_cyl * 0.5 * (icor ** 2) * domegadt)
-    tau = get_stress(T, fill_volume_m3)
+    corresponding stress experienced by the fluid. See couette_cell.stress.
+    '''
+    return cell.stress(torque_Nm, fill_volume_ml)
+
+def get_torque(stress_Pa, fill_volume_ml):
+    '''
+    get_torque(stress_Pa, fill_volume_ml)
+    
+    Inverse of get_stress: the torque on the inner cylinder which gives a stress in the fluid.
+    '''
+    return cell.torque(stress_Pa, fill_volume_ml)
+
+def calc_mu(st, Vms_V, Ims_A, fill_volume_ml, omega_rads, dwdt_override=None):
+    '''
+    calc_mu(st, Vms_V, Ims_A, fill_volume_ml, omega_rads, **kwargs)
+    
+    Calculates the strain rate, torque, stress and viscosity from the motor current and speed.
+    
+    Works on single readings, on whole runs (1D arrays), or on many runs at once (2D arrays with one 
+    run per row, sharing a 1D time array or each with their own).
+    
+    Parameters:
+        st              (float/array)       Time of each reading (s). For single readings, this is ignored
+                                            and dwdt_override is used for the angular acceleration.
+        Vms_V           (float/array)       Motor supply voltage (V). Currently unused.
+        Ims_A           (float/array)       Motor supply current (A).
+        fill_volume_ml  (float)             Volume of fluid in the cell (ml).
+        omega_rads      (float/array)       Angular speed of the inner cylinder (rad/s).
+    
+    **kwargs:
+        dwdt_override   (float)             Angular acceleration (rad/s^2) to use for single readings. Default
+                                            is 0
+    
+    Returns:
+        gamma_dot, T, tau, mu
+    '''
+    omega_rads = np.asarray(omega_rads, np.float64)
+    Ims_A = np.asarray(Ims_A, np.float64)
+    gamma_dot = cell.strain(omega_rads)
+    
+    if np.ndim(st) == 0:
+        domegadt = 0.0
+        if dwdt_override: domegadt = dwdt_override
+    else:
+        # backward difference along time, zero for the first reading
+        st = np.asarray(st, np.float64)
+        domegadt = np.zeros(np.broadcast(st, omega_rads).shape, np.float64)
+        domegadt[..., 1:] = np.diff(omega_rads, axis=-1) / np.diff(st, axis=-1)
+    
+    T = kv * Ims_A - (I_cyl * domegadt)
+    tau = cell.stress(T, fill_volume_ml)
     mu = tau / gamma_dot
-    return gamma_dot, T, tau, mu
+    return gamma_dot[()], T[()], tau[()], mu[()]
 
 ######################################################################################################################## PLOT STUFF
 def fit_line(x, y, dg, x_name="x", y_name="y"):
@@ -295,6 +443,7 @@ def fit_line(x, y, dg, x_name="x", y_name="y"):
 
 def plot_fit(x, y, dg, x_name="x", y_name="y", outp="./test.png"):
     fit, fit_eqn, coeffs = fit_line(x, y, dg, x_name="x", y_name="y")
+    plt = pyplot()
     f = plt.figure()
     ax = plt.gca()
     ax.plot(x, y, "x", label="{}({})".format(y_name, x_name))
@@ -311,11 +460,87 @@ class LogTooShortError(Exception):
     def __str__(self):
         return "Log too short :("
 
+def read_binlog(log_n):
+    '''
+    read_binlog(log_n)
+    
+    Memory maps a binary log file (see binlog.py) as a numpy record array. Columns are accessed by name
+    (e.g. log['spd0']) and are only read from disk as they are used.
+    '''
+    dtype, offset = binlog.read_header(log_n)
+    n = (os.path.getsize(log_n) - offset) // dtype.itemsize  # ignore any partly written record
+    if n == 0: return np.zeros(0, dtype)
+    return np.memmap(log_n, dtype=dtype, mode='r', offset=offset, shape=(n,))
+
+spd_columns = ["spd0", "spd1", "spd2", "spd3", "spd4", "spd5"]
+spd_columns_old = ["f_spd0", "r_spd0", "f_spd1", "r_spd1", "f_spd2", "r_spd2"] # names used by older logs
+
+def log_column(datf, *names):
+    '''
+    log_column(datf, *names)
+    
+    Gets a column from a log as a float64 array, trying each of (names) in turn. Returns None if none
+    of the names are present.
+    '''
+    for n in names:
+        try:
+            return np.array(datf[n], np.float64)
+        except (KeyError, ValueError):
+            pass
+    return None
+
+def clean_mask(spds, max_speed=4000.0):
+    '''
+    clean_mask(spds, **kwargs)
+    
+    Finds the usable rows of a log: those where no speed reading is zero or unreasonably high.
+    
+    Parameters:
+        spds        (2D array)          Speed readings, one row per speed column.
+    
+    **kwargs:
+        max_speed   (float)             Readings above this (rpm) are treated as errors. Default is 4000
+    
+    Returns:
+        keep        (array, bool)       True for every usable row.
+    '''
+    spds = np.asarray(spds)
+    return np.all((spds != 0.0) & (spds <= max_speed), axis=0)
+
+def active_speeds(spds):
+    '''
+    active_speeds(spds)
+    
+    Selects the speed columns which hold readings, ignoring those that are only padding (spd_pad).
+    
+    Parameters:
+        spds        (2D array)          Speed readings, one row per speed column.
+    
+    Returns:
+        active      (2D array)          The rows of spds that are in use (or all rows, if none appear to be).
+    '''
+    spds = np.asarray(spds)
+    active = np.any(spds != spd_pad, axis=1)
+    if not np.any(active): return spds
+    return spds[active]
+
 def read_logf(log_n, strip_outliers=False, strip_0speed=False, filter_readings=False, f0_is_omega_rpm=False, cra_is_Ims_A=False, dia=False):
     '''
-    read_logf(log_n)
+    read_logf(log_n, **kwargs)
     
-    Reads a .csv log file and outputs the columns as numpy arrays (float64).
+    Reads a .csv or binary log file and outputs the columns as numpy arrays (float64).
+    
+    **kwargs:
+        strip_outliers  (bool)          Not yet implemented. Default is False
+        strip_0speed    (bool)          Remove every row where any speed is zero or above 4000 rpm. Default is False
+        filter_readings (bool)          Filter the speeds, Vms and Vcr. Default is False
+        f0_is_omega_rpm (bool)          Replace spd0 with the average speed (rpm) and spd1 with the same in rad/s.
+                                        Default is False
+        cra_is_Ims_A    (bool)          Convert Vcr to the motor supply current (A). Default is False
+        dia             (bool)          Turn on all of the above. Default is False
+    
+    Returns:
+        t, st, spd0, spd1, spd2, spd3, spd4, spd5, Vcr, adc0, Tc, Vpz, Vms, gamma_dot, tau, "na"
     '''
     if dia:
         strip_outliers = True
@@ -324,27 +549,25 @@ def read_logf(log_n, strip_outliers=False, strip_0speed=False, filter_readings=F
         f0_is_omega_rpm = True
         cra_is_Ims_A = True
         
-    datf = pd.read_csv(log_n)
-    
-    t         =   np.array(datf['t'], np.float64)
-    spd0      =   np.array(datf['spd0'], np.float64)
-    spd1      =   np.array(datf['spd1'], np.float64)
-    spd2      =   np.array(datf['spd2'], np.float64)
-    spd3      =   np.array(datf['spd3'], np.float64)
-    spd4      =   np.array(datf['spd4'], np.float64)
-    spd5      =   np.array(datf['spd5'], np.float64)
-    Vcr       =   np.array(datf['Vcr'], np.float64)
-    adc0      =   np.array(datf['adc0'], np.float64)
-    Vms       =   np.array(datf['Vms'], np.float64)
-    Tc        =   np.array(datf['Tc'], np.float64)
-    Vpz       =   np.array(datf['Vpz'], np.float64)
-    
-    try:
-        tau       =   np.array(datf['tau'], np.float64)
-        gamma_dot =   np.array(datf['gamma_dot'], np.float64)
-    except:
-        tau       = [0] * len(t)
-        gamma_dot = [0] * len(t)
+    if binlog.is_binlog(log_n):
+        datf = read_binlog(log_n)
+    else:
+        import pandas as pd
+        datf = pd.read_csv(log_n)
+    
+    t         =   log_column(datf, 't')
+    spds      =   np.array([log_column(datf, n, o) for n, o in zip(spd_columns, spd_columns_old)])
+    Vcr       =   log_column(datf, 'Vcr', 'cra')
+    adc0      =   log_column(datf, 'adc0', 'crb')
+    Vms       =   log_column(datf, 'Vms')
+    Tc        =   log_column(datf, 'T', 'Tc')
+    Vpz       =   log_column(datf, 'Vpz')
+    tau       =   log_column(datf, 'tau')
+    gamma_dot =   log_column(datf, 'gamma_dot')
+    
+    if tau is None or gamma_dot is None:
+        tau       = np.zeros(len(t))
+        gamma_dot = np.zeros(len(t))
     
     st = t - t[0]
     
@@ -352,46 +575,177 @@ def read_logf(log_n, strip_outliers=False, strip_0speed=False, filter_readings=F
         # do nothing at the moment, but will remove data points that are out of scope or whatever
         pass
     if strip_0speed:
-            i_off = 0
-            i = 0
-            # lose unusable data
-            for j in range(len(st)):
-                i = j - i_off
-                if f_spd0[i] == 0 or f_spd1[i] == 0 or f_spd2[i] == 0 or r_spd0[i] == 0 or r_spd1[i] == 0 or r_spd2[i] == 0 or \
-                    f_spd0[i] > 4000 or f_spd1[i] > 4000 or f_spd2[i] > 4000 or r_spd0[i] > 4000 or r_spd1[i] > 4000 or r_spd2[i] > 4000:
-                    st = np.delete(st, i)
-                    f_spd0 = np.delete(f_spd0, i)
-                    r_spd0 = np.delete(r_spd0, i)
-                    f_spd1 = np.delete(f_spd1, i)
-                    r_spd1 = np.delete(r_spd1, i)
-                    f_spd2 = np.delete(f_spd2, i)
-                    r_spd2 = np.delete(r_spd2, i)
-                    cra = np.delete(cra, i)
-                    crb = np.delete(crb, i)
-                    Tc = np.delete(Tc, i)
-                    Vpz = np.delete(Vpz, i)
-                    Vms = np.delete(Vms, i)
-                    i_off += 1
+        # lose unusable data, in one pass
+        keep = clean_mask(spds)
+        t, st, Vcr, adc0, Tc, Vpz, Vms, gamma_dot, tau = [c[keep] for c in (t, st, Vcr, adc0, Tc, Vpz, Vms, gamma_dot, tau)]
+        spds = spds[:, keep]
+    if len(st) <= 9: raise LogTooShortError
     if filter_readings:
-        f_spd0 = filter(st, f_spd0)
-        r_spd0 = filter(st, r_spd0)
-        f_spd1 = filter(st, f_spd1)
-        r_spd1 = filter(st, r_spd1)
-        f_spd2 = filter(st, f_spd2)
-        r_spd2 = filter(st, r_spd2)
-        Vms = filter(st, Vms)
-        cra = filter(st, cra)
+        from filter import filter
+        filtered = filter(st, np.vstack([spds, Vms, Vcr]))  # every column in one pass
+        spds, Vms, Vcr = filtered[:len(spds)], filtered[-2], filtered[-1]
     if f0_is_omega_rpm:
-        for i in range(len(f_spd0)):
-            f_spd0[i] = np.average([f_spd0[i], r_spd0[i], f_spd1[i], r_spd1[i], f_spd2[i], r_spd2[i]])
-        r_spd0 = f_spd0 * (2.0 * np.pi / 60)
+        spds[0] = np.average(active_speeds(spds), axis=0)
+        spds[1] = spds[0] * (2.0 * np.pi / 60)
     if cra_is_Ims_A:
-        cra = (cra - 2.5) / 0.185
-    if len(f_spd0) <= 9: raise LogTooShortError
+        Vcr = get_current(Vcr)
     
+    spd0, spd1, spd2, spd3, spd4, spd5 = spds
     return t, st, spd0, spd1, spd2, spd3, spd4, spd5, Vcr, adc0, Tc, Vpz, Vms, gamma_dot, tau, "na"
     
 
+######################################################################################################################## STREAMING
+log_aliases = dict(zip(spd_columns, [[o] for o in spd_columns_old]))
+log_aliases.update({"Vcr":["cra"], "adc0":["crb"], "T":["Tc"], "dc":["pv"]})
+
+def log_names(log_n):
+    '''
+    log_names(log_n)
+    
+    Gets the names of the columns in a .csv or binary log, without reading the data.
+    '''
+    if binlog.is_binlog(log_n):
+        return list(binlog.read_header(log_n)[0].names)
+    with open(log_n, "r") as f:
+        return [n.strip() for n in f.readline().split(",")]
+
+def iter_logf(log_n, chunksize=100000, columns=None):
+    '''
+    iter_logf(log_n, **kwargs)
+    
+    Reads a .csv or binary log file in fixed size chunks, so that logs of any length can be processed
+    in constant memory.
+    
+    Columns are named as in the current log schema (spd0, Vcr, T, ...) even when reading older logs 
+    (see log_aliases).
+    
+    **kwargs:
+        chunksize   (integer)           Number of rows per chunk. Default is 100000
+        columns     (list, string)      Columns to read. Default is every column in the log.
+    
+    Yields:
+        chunk       (dict)              Column name -> float64 array, for up to chunksize rows.
+    '''
+    present = log_names(log_n)
+    if columns is None:
+        columns = present
+    
+    # name in file for every column wanted
+    names = dict()
+    for c in columns:
+        for n in [c] + log_aliases.get(c, []):
+            if n in present:
+                names[c] = n
+                break
+        else:
+            raise KeyError("Column {} not in log {}".format(c, log_n))
+    
+    if binlog.is_binlog(log_n):
+        log = read_binlog(log_n)
+        for i in range(0, len(log), chunksize):
+            chunk = log[i:i + chunksize]
+            yield dict((c, np.array(chunk[n], np.float64)) for c, n in names.items())
+    else:
+        import pandas as pd
+        for datf in pd.read_csv(log_n, chunksize=chunksize, usecols=list(set(names.values()))):
+            yield dict((c, np.array(datf[n], np.float64)) for c, n in names.items())
+
+class running_stats(object):
+    '''
+    Usage:
+    
+    object = dproc.running_stats()
+    
+    Keeps the count, mean, variance, minimum and maximum of a series which arrives in chunks, without 
+    keeping the series itself.
+    '''
+    
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+    
+    def update(self, x):
+        '''
+        running_stats.update(x)
+        
+        Adds a chunk of values. NaNs and infinities are ignored.
+        '''
+        x = np.asarray(x, np.float64).ravel()
+        x = x[np.isfinite(x)]
+        nb = len(x)
+        if nb == 0: return
+        mb = np.mean(x)
+        m2b = np.sum((x - mb) ** 2)
+        
+        # combine with what has been seen so far [Chan et al. 1979]
+        n = self.n + nb
+        delta = mb - self.mean
+        self.mean += delta * nb / n
+        self.m2 += m2b + (delta ** 2) * self.n * nb / n
+        self.n = n
+        self.min = min(self.min, np.min(x))
+        self.max = max(self.max, np.max(x))
+    
+    def var(self):
+        if self.n == 0: return 0.0
+        return self.m2 / self.n
+    
+    def std(self):
+        return self.var() ** 0.5
+
+def stream_viscosity(log_n, fill_volume_ml=15, chunksize=100000, strip_0speed=True):
+    '''
+    stream_viscosity(log_n, **kwargs)
+    
+    Calculates the averages of the results of calc_mu for a whole log, one chunk at a time, in constant
+    memory. Speeds are averaged as in read_logf(f0_is_omega_rpm=True); readings are not filtered.
+    
+    **kwargs:
+        fill_volume_ml  (float)         Volume of fluid in the cell (ml). Default is 15
+        chunksize       (integer)       Number of rows per chunk. Default is 100000
+        strip_0speed    (bool)          Ignore rows where any speed is zero or above 4000 rpm. Default is True
+    
+    Returns:
+        stats           (dict)          Running statistics (running_stats) for each of 'T', 'omega', 'tau',
+                                        'gamma_dot' and 'mu'.
+    '''
+    stats = dict((k, running_stats()) for k in ["T", "omega", "tau", "gamma_dot", "mu"])
+    t0 = None
+    last = None  # (st, Vms, Ims, omega) of the last reading of the previous chunk
+    
+    for chunk in iter_logf(log_n, chunksize=chunksize, columns=["t", "Vcr", "Vms"] + spd_columns):
+        spds = np.array([chunk[n] for n in spd_columns])
+        t, Vcr, Vms = chunk["t"], chunk["Vcr"], chunk["Vms"]
+        if strip_0speed:
+            keep = clean_mask(spds)
+            spds, t, Vcr, Vms = spds[:, keep], t[keep], Vcr[keep], Vms[keep]
+        if len(t) == 0: continue
+        if t0 is None: t0 = t[0]
+        
+        st = t - t0
+        omega_rads = np.average(active_speeds(spds), axis=0) * (2.0 * np.pi / 60)
+        Ims_A = get_current(Vcr)
+        
+        # carry the previous reading over, so dw/dt is continuous across chunks
+        if last is not None:
+            st = np.concatenate([[last[0]], st])
+            Vms = np.concatenate([[last[1]], Vms])
+            Ims_A = np.concatenate([[last[2]], Ims_A])
+            omega_rads = np.concatenate([[last[3]], omega_rads])
+        gamma_dot, T, tau, mu = calc_mu(st, Vms, Ims_A, fill_volume_ml, omega_rads)
+        s = 0 if last is None else 1
+        last = (st[-1], Vms[-1], Ims_A[-1], omega_rads[-1])
+        
+        stats["T"].update(T[s:])
+        stats["omega"].update(omega_rads[s:])
+        stats["tau"].update(tau[s:])
+        stats["gamma_dot"].update(gamma_dot[s:])
+        stats["mu"].update(mu[s:])
+    return stats
+
 def get_significant_minimums(y, sens=10):
     '''
     get_significant_minimums(y, **kwargs)
@@ -7,6 +7,9 @@
 '''
     Pretends to be the GPIO package if program is not run on a Raspberry Pi.
     
+    Keeps track of input levels, edge callbacks and PWM outputs, so that a simulated rig (simhw.py) can 
+    read the duty cycle and drive the inputs with set_input().
+    
     Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
 '''
 
@@ -26,17 +29,37 @@ RISING = 0
 FALLING = 1
 BOTH = 2
 
+levels = dict() # input pin: level
+callbacks = dict() # input pin: (edge, callback)
+pwms = dict() # output pin: PWM
+
 def output(channel, value):
     pass
     
 def input(channel):
-    return 0
+    return levels.get(channel, 0)
+
+def set_input(channel, value):
+    '''
+    set_input(channel, value)
+    
+    Sets the level of an input pin, as if from outside, calling its edge callback if the level changed.
+    '''
+    value = 1 if value else 0
+    old = levels.get(channel, 0)
+    levels[channel] = value
+    if value == old or channel not in callbacks: return
+    edge, callback = callbacks[channel]
+    if callback is None: return
+    if (edge == BOTH) or (edge == RISING and value) or (edge == FALLING and not value):
+        callback(channel)
 
 class PWM(object):
     def __init__(self, channel, frequency):
         self.channel = channel
         self.frequency = frequency
         self.dc = 0.5
+        pwms[channel] = self
     
     def start(self, dc):
         self.dc = dc
@@ -57,13 +80,17 @@ def setup(channel, direction, pull_up_down=0):
     pass
 
 def add_event_detect(pin, direction, callback=None):
-    pass
+    callbacks[pin] = (direction, callback)
+
+def remove_event_detect(pin):
+    callbacks.pop(pin, None)
 
 def setwarnings(b):
     pass
 
 def cleanup():
-    pass
+    callbacks.clear()
+    pwms.clear()
 
 if __name__ == "__main__":
     print __doc__
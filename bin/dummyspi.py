@@ -0,0 +1,35 @@
+'''
+    Pretends to be the spidev package if program is not run on a Raspberry Pi.
+
+    Answers MCP3008 conversion frames. Every channel reads zero, unless a simulated rig is
+    attached (backend, see simhw.py), in which case the rig gives the reading.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+backend = None # object with adc_counts(channel) -> 10-bit reading, or None
+
+
+class SpiDev(object):
+    def __init__(self):
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.is_open = False
+
+    def open(self, bus, device):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def xfer2(self, data):
+        # single ended conversion: start bit and SGL/DIFF in the top two bits, channel in the next three
+        channel = (data[0] >> 3) & 0x07
+        value = backend.adc_counts(channel) if backend is not None else 0
+        return [(value >> 9) & 0x01, (value >> 1) & 0xFF, (value & 0x01) << 7]
+
+    def writebytes(self, data):
+        pass
+
+if __name__ == "__main__":
+    print __doc__
@@ -6,46 +6,221 @@
 
 # System
 from enum import Enum as enum
+from functools import wraps
 
 # 3rd Party
 import numpy as np  # for maths
-from scipy.interpolate import UnivariateSpline  # for splining
-from scipy.signal import wiener, filtfilt, butter, gaussian  # for fliter-making
-from scipy.ndimage import filters # for applying filters
+from numpy.lib.stride_tricks import as_strided  # for sliding windows
+# scipy is imported where it's used, so that the streaming filters without it (gaussian, exponential,
+# median) can be used on the control path without the import time
 
 class ftype(enum):
     gaussian    = 0
     butterworth = 1
     wiener      = 2
     spline      = 3
-        
-def gaussianf(x, y, sample_size=51, sigma=7):
-	b = gaussian(sample_size, sigma)
-	ga = filters.convolve1d(y, b/b.sum())
+    segmented_spline = 4
+
+designs = dict()  # (design function name, parameters): design, see memoise
+
+def memoise(design):
+    # keeps the result of a filter design function, so each design is only made once for each set of 
+    # parameters. Designs are shared, so they're made read only.
+    @wraps(design)
+    def cached(*args):
+        key = (design.__name__,) + args
+        out = designs.get(key)
+        if out is None:
+            out = design(*args)
+            for arr in (out if isinstance(out, tuple) else (out,)):
+                arr.flags.writeable = False
+            designs[key] = out
+        return out
+    return cached
+
+@memoise
+def butter_ba(order, nyq):
+	from scipy.signal import butter
+	return butter(order, nyq)
+
+@memoise
+def butter_sos(order, nyq):
+	from scipy.signal import butter
+	return butter(order, nyq, output='sos')
+
+@memoise
+def gaussian_window(sample_size, sigma):
+	# as scipy.signal.gaussian, normalised to sum to 1
+	n = np.arange(sample_size) - (sample_size - 1) / 2.0
+	b = np.exp(-0.5 * (n / float(sigma)) ** 2)
+	return b / b.sum()
+
+pools = dict()  # threads: ThreadPool
+
+def get_pool(threads):
+    if threads not in pools:
+        from multiprocessing.pool import ThreadPool
+        pools[threads] = ThreadPool(threads)
+    return pools[threads]
+
+def apply_blocks(func, y, axis=-1, threads=1):
+    '''
+    apply_blocks(func, y, **kwargs)
+    
+    Applies func(y), which filters along (axis), with the signals split between (threads) threads. Only
+    worth doing where func spends its time in code which releases the GIL.
+    
+    Parameters:
+        func        (function)      Filter, taking and returning an array of signals.
+        y           (array)         Signals.
+    
+    **kwargs:
+        axis        (integer)       Axis along which each signal lies. Default is -1
+        threads     (integer)       Number of threads. Default is 1 (no pool)
+    '''
+    if threads <= 1 or y.ndim < 2: return func(y)
+    other = 1 if (axis % y.ndim) == 0 else 0
+    n = min(threads, y.shape[other])
+    if n <= 1: return func(y)
+    blocks = np.array_split(y, n, axis=other)
+    return np.concatenate(get_pool(threads).map(func, blocks), axis=other)
+
+def gaussianf(x, y, sample_size=51, sigma=7, axis=-1):
+	from scipy.ndimage import filters
+	ga = filters.convolve1d(y, gaussian_window(sample_size, sigma), axis=axis)
 	return ga
 
-def butterworthf(x, y, order=4, nyq=0.008):
-	b, a = butter(order, nyq)
-	fl = filtfilt(b, a, y)
+def butterworthf(x, y, order=4, nyq=0.008, axis=-1):
+	from scipy.signal import filtfilt
+	b, a = butter_ba(order, nyq)
+	fl = filtfilt(b, a, y, axis=axis)
 	return fl
  
-def wienerf(y, sample_size=29):
-	wi = wiener(y, sample_size)
+def wienerf(y, sample_size=29, axis=-1):
+	# the noise is estimated from the whole of each signal, so signals are done one at a time
+	from scipy.signal import wiener
+	wi = np.apply_along_axis(wiener, axis, y, sample_size)
 	return wi
  
-def splinef(x, y, sample_size=100):
-	sp = UnivariateSpline(x, y, s=sample_size)
-	return sp(x)
+def splinef(x, y, sample_size=100, axis=-1):
+	from scipy.interpolate import UnivariateSpline
+	sp = np.apply_along_axis(lambda yi: UnivariateSpline(x, yi, s=sample_size)(x), axis, y)
+	return sp
+    
+def noise_std(y):
+    '''
+    noise_std(y)
+    
+    Estimates the standard deviation of the (white) noise on a smooth signal, from the RMS of its second
+    differences (which have 6 times the noise variance). Spikes count as noise: they add to the squared
+    residuals a smoothing spline has to allow for.
+    '''
+    d2 = np.diff(y, 2)
+    d2 = d2[np.isfinite(d2)]
+    if len(d2) == 0: return 0.0
+    return np.sqrt(np.mean(d2 * d2) / 6.0)
+
+def segments(n, length, overlap):
+    # (start, stop) of segments of (length) samples covering range(n), overlapping by at least (overlap)
+    if n <= length: return [(0, n)]
+    step = max(length - overlap, 1)
+    bounds = list()
+    for start in range(0, n, step):
+        stop = start + length
+        if stop >= n:
+            bounds.append((n - length, n))
+            break
+        bounds.append((start, stop))
+    return bounds
+
+def fit_segment(args):
+    # smoothed values of one segment (for ThreadPool.map); samples which aren't finite are left out of the
+    # fit. If too many are missing to place a knot, the segment falls back to the smoothing spline.
+    from scipy.interpolate import UnivariateSpline, LSQUnivariateSpline
+    x, y, s, knot_spacing = args
+    ok = np.isfinite(y)
+    xf, yf = x[ok], y[ok]
+    if len(xf) <= 3:
+        raise ValueError("Only {} finite samples in a segment of {}; too few for a cubic spline".format(len(xf), len(x)))
+    if knot_spacing:
+        knots = xf[knot_spacing:len(xf) - knot_spacing:knot_spacing]
+        if len(knots): return LSQUnivariateSpline(xf, yf, knots)(x)
+    return UnivariateSpline(xf, yf, s=s * len(xf))(x)
+
+def segsplinef(x, y, segment=1000, overlap=100, smoothing=1.0, knot_spacing=0, threads=1):
+    '''
+    segsplinef(x, y, **kwargs)
+    
+    Smoothing spline for long signals. Rather than one spline over the whole signal (whose cost grows 
+    quickly with its length), splines are fitted to overlapping segments, and blended together across the 
+    overlaps with linear weights.
     
-def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314):
+    The smoothing factor of each segment is (smoothing * samples * noise variance): the expected sum of squared
+    residuals if the spline followed the underlying signal. So the result doesn't depend on the length of the
+    log, or the units of y. The noise is estimated from the whole signal (see noise_std), and taken as at least
+    1/1000th of its standard deviation.
+    
+    With knot_spacing, each segment is instead a least squares spline with a knot every (knot_spacing) 
+    samples; quicker still, and the knot spacing sets the smoothness directly.
+    
+    Samples which aren't finite are left out of the fits. A ValueError is raised if a segment has too few 
+    finite samples (under 4) for a cubic spline.
+    
+    Parameters:
+        x           (array)         The x data for the signal (usually time), strictly increasing.
+        y           (array)         The noisy signal.
+    
+    **kwargs:
+        segment     (integer)       Samples in each segment. Default is 1000
+        overlap     (integer)       Samples by which segments overlap. Default is 100
+        smoothing   (float)         Smoothing factor, relative to the noise. Default is 1
+        knot_spacing (integer)      Samples between knots, or 0 to let the smoothing factor decide. Default is 0
+        threads     (integer)       Number of threads to fit segments in. Default is 1
+    
+    Returns:
+        out         (array)         The smoothed signal.
+    '''
+    x = np.asarray(x, np.float64)
+    y = np.asarray(y, np.float64)
+    n = len(y)
+    scale = np.nanstd(y)
+    if not scale > 1e-9 * np.nanmax(np.abs(y)): return y.copy()  # constant, e.g. an unused speed channel
+    # an already smooth signal needn't be followed to its rounding error, which takes a knot at almost every sample
+    sigma = max(noise_std(y), 1e-3 * scale)
+    s = smoothing * sigma ** 2
+    bounds = segments(n, max(int(segment), 2 * int(knot_spacing) + 4), int(overlap))
+    jobs = [(x[a:b], y[a:b], s, int(knot_spacing)) for a, b in bounds]
+    if threads > 1 and len(jobs) > 1:
+        fits = get_pool(threads).map(fit_segment, jobs)
+    else:
+        fits = [fit_segment(job) for job in jobs]
+    
+    # blend: weights ramp up over the start of each segment and down over its end, except at the ends of y
+    num = np.zeros(n)
+    den = np.zeros(n)
+    ramp = max(int(overlap), 1)
+    for (a, b), fit in zip(bounds, fits):
+        j = np.arange(b - a, dtype=np.float64)
+        w = np.ones(b - a)
+        if a > 0: w = np.minimum(w, (j + 1.0) / (ramp + 1.0))
+        if b < n: w = np.minimum(w, (b - a - j) / (ramp + 1.0))
+        num[a:b] += w * fit
+        den[a:b] += w
+    return num / den
+
+def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314, axis=-1, threads=1):
     '''
     Filter for filtering noise out from a signal.
     
     Arguments:
         x           The x data for the singal (usually time)
-        y           The noisy signal data
+        y           The noisy signal data. A 2D array is a number of signals (e.g. log columns) at once, 
+                    all filtered in one pass.
         method      Which filter to use. 'ftype.butterworth' by default.
-        A, B        Parameters of the filter to be used.
+        A, B        Parameters of the filter to be used. For ftype.segmented_spline, the smoothing (relative 
+                    to the noise) and knot spacing (samples, 0 for automatic knots): see segsplinef.
+        axis        Axis of y along which each signal lies. -1 (the last) by default.
+        threads     Number of threads to split the signals between, for 2D y. 1 by default.
     
     Returns:
         List of filtered y-values.
@@ -61,13 +236,14 @@ def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314):
         use_B = False
 
     output = [0] * 0
+    y = np.asarray(y, np.float64)
 
     if method == ftype.wiener:
         
         if not use_A:
             A = 29
         
-        output = wienerf(y, sample_size=A)
+        output = apply_blocks(lambda yb: wienerf(yb, sample_size=A, axis=axis), y, axis, threads)
 
     elif method == ftype.gaussian:
 
@@ -77,7 +253,7 @@ def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314):
         if not use_B:
             B = 7
         
-        output = gaussianf(x, y, sample_size=A, sigma=B)
+        output = apply_blocks(lambda yb: gaussianf(x, yb, sample_size=A, sigma=B, axis=axis), y, axis, threads)
 
     elif method == ftype.butterworth:
 
@@ -87,14 +263,26 @@ def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314):
         if not use_B:
             B = 0.008
 
-        output = butterworthf(x, y, order=A, nyq=B)
+        output = apply_blocks(lambda yb: butterworthf(x, yb, order=A, nyq=B, axis=axis), y, axis, threads)
 
     elif method == ftype.spline:
         
         if not use_A:
             A = 100
 
-        output = splinef(x, y, sample_size=A)
+        output = apply_blocks(lambda yb: splinef(x, yb, sample_size=A, axis=axis), y, axis, threads)
+
+    elif method == ftype.segmented_spline:
+        
+        if not use_A:
+            A = 1.0
+
+        if not use_B:
+            B = 0
+        
+        # threads are used for the segments, rather than the signals
+        output = np.apply_along_axis(lambda yi: segsplinef(x, yi, smoothing=A, knot_spacing=B, threads=threads),
+                                     axis, y)
 
     else:
 
@@ -102,7 +290,201 @@ def filter(x, y, method=ftype.butterworth, A=0.314, B=0.314):
     
     return output
     
+######################################################################################################################## STREAMING
+class stream_filter(object):
+    '''
+    Usage:
+    
+    object = filter.stream_filter()
+    
+    Base of the streaming filters below, for live data (e.g. the speed in motor.control). They are causal: 
+    samples are passed in as they arrive, a chunk at a time, with update(), and the state of the filter is 
+    kept between calls, so the output is the same however the signal is split into chunks. The state starts 
+    as if the signal had always been at its first sample, so there is no start up transient.
+    '''
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        '''
+        stream_filter.reset()
+        
+        Clears the state of the filter; the next sample starts it afresh.
+        '''
+        self.state = None
+    
+    def update(self, chunk):
+        '''
+        stream_filter.update(chunk)
+        
+        Filters the next samples of the signal.
+        
+        Parameters:
+            chunk       (float/array)   The next sample, or a 1D array of the next samples.
+        
+        Returns:
+            out         (float/array)   The filtered sample(s), the same shape as chunk.
+        '''
+        x = np.asarray(chunk, np.float64)
+        y = np.atleast_1d(x)
+        if len(y) == 0: return y.copy()
+        if self.state is None: self.state = self.initial_state(y[0])
+        y = self.process(y)
+        return y[0] if x.ndim == 0 else y
+
+class stream_butterworth(stream_filter):
+    '''
+    Usage:
+    
+    object = filter.stream_butterworth(**kwargs)
+    
+    Streaming Butterworth low pass filter, as second order sections (stable at any order). This is a single 
+    forward pass of the filter which filter(method=ftype.butterworth) applies forwards and backwards, so it has the
+    same cut off but a phase lag, and a less steep roll off. Needs scipy.
+    
+    **kwargs:
+        order       (integer)       Order of the filter. Default is 2
+        nyq         (float)         Cut off frequency, as a fraction of the Nyquist frequency. Default is 0.008
+    '''
+    
+    def __init__(self, order=2, nyq=0.008):
+        '''
+        object = filter.stream_butterworth(**kwargs)
+        
+        Streaming Butterworth low pass filter, as second order sections. See stream_butterworth.__doc__.
+        
+        **kwargs:
+            order       (integer)       Order of the filter. Default is 2
+            nyq         (float)         Cut off frequency, as a fraction of the Nyquist frequency. Default is 0.008
+        '''
+        from scipy.signal import sosfilt, sosfilt_zi
+        self.sos = butter_sos(order, nyq)
+        self.zi = sosfilt_zi(self.sos)  # state for a signal which has always been 1
+        self.sosfilt = sosfilt
+        stream_filter.__init__(self)
+    
+    def initial_state(self, x0):
+        return self.zi * x0
+    
+    def process(self, x):
+        y, self.state = self.sosfilt(self.sos, x, zi=self.state)
+        return y
+
+class stream_gaussian(stream_filter):
+    '''
+    Usage:
+    
+    object = filter.stream_gaussian(**kwargs)
+    
+    Streaming moving Gaussian (FIR) filter. The same window as filter(method=ftype.gaussian), applied to the 
+    last (sample_size) samples rather than centred, so the output matches the offline filter delayed by 
+    stream_gaussian.delay samples.
+    
+    **kwargs:
+        sample_size (integer)       Length of the window (samples). Default is 51
+        sigma       (float)         Standard deviation of the window (samples). Default is 7
+    '''
+    
+    def __init__(self, sample_size=51, sigma=7):
+        '''
+        object = filter.stream_gaussian(**kwargs)
+        
+        Streaming moving Gaussian (FIR) filter. See stream_gaussian.__doc__.
+        
+        **kwargs:
+            sample_size (integer)       Length of the window (samples). Default is 51
+            sigma       (float)         Standard deviation of the window (samples). Default is 7
+        '''
+        self.b = gaussian_window(sample_size, sigma)
+        self.delay = (sample_size - 1) / 2.0
+        stream_filter.__init__(self)
+    
+    def initial_state(self, x0):
+        # the last (sample_size - 1) samples
+        return np.full(len(self.b) - 1, x0)
+    
+    def process(self, x):
+        buf = np.concatenate([self.state, x])
+        self.state = buf[len(buf) - len(self.state):]
+        return np.convolve(buf, self.b, 'valid')
+
+class stream_exponential(stream_filter):
+    '''
+    Usage:
+    
+    object = filter.stream_exponential(**kwargs)
+    
+    Streaming exponential moving average: each output moves (alpha) of the way from the last output to the 
+    new sample. The cheapest of the filters, for single samples; longer chunks are done in a python loop.
+    
+    **kwargs:
+        alpha       (float)         Smoothing factor, 0 (output never changes) to 1 (no smoothing). The time 
+                                    constant is about 1/alpha samples. Default is 0.1
+    '''
+    
+    def __init__(self, alpha=0.1):
+        '''
+        object = filter.stream_exponential(**kwargs)
+        
+        Streaming exponential moving average. See stream_exponential.__doc__.
+        
+        **kwargs:
+            alpha       (float)         Smoothing factor, 0 (output never changes) to 1 (no smoothing). Default 
+                                        is 0.1
+        '''
+        self.alpha = float(alpha)
+        stream_filter.__init__(self)
+    
+    def initial_state(self, x0):
+        return float(x0)
+    
+    def process(self, x):
+        y = np.empty(len(x))
+        s, a = self.state, self.alpha
+        for i in range(len(x)):
+            s += a * (x[i] - s)
+            y[i] = s
+        self.state = s
+        return y
+
+class stream_median(stream_filter):
+    '''
+    Usage:
+    
+    object = filter.stream_median(**kwargs)
+    
+    Streaming moving median: the median of the last (sample_size) samples. Removes spikes (e.g. a missed 
+    encoder edge) without smearing them out; the output is delayed by about stream_median.delay samples.
+    
+    **kwargs:
+        sample_size (integer)       Length of the window (samples). Default is 5
+    '''
+    
+    def __init__(self, sample_size=5):
+        '''
+        object = filter.stream_median(**kwargs)
+        
+        Streaming moving median. See stream_median.__doc__.
+        
+        **kwargs:
+            sample_size (integer)       Length of the window (samples). Default is 5
+        '''
+        self.sample_size = int(sample_size)
+        self.delay = (self.sample_size - 1) / 2.0
+        stream_filter.__init__(self)
+    
+    def initial_state(self, x0):
+        return np.full(self.sample_size - 1, x0)
+    
+    def process(self, x):
+        buf = np.concatenate([self.state, x])
+        self.state = buf[len(buf) - len(self.state):]
+        windows = as_strided(buf, shape=(len(x), self.sample_size), strides=(buf.strides[0], buf.strides[0]))
+        return np.median(windows, axis=1)
+
 if __name__ == "__main__":
     print __doc__
     print filter.__doc__
+    print stream_filter.__doc__
     
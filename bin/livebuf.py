@@ -0,0 +1,237 @@
+'''
+    Rolling buffer of live, processed readings.
+
+    Filled by the acquisition thread (motor.poll) with one row of processed values per sample;
+    read by the UI, or anything else, without touching the sensors or repeating the processing.
+    Statistics over the most recent window are kept up to date as rows are added, so a query
+    costs the same however many rows there are:
+
+        mean, std   Running sums, added to as rows come in and taken from as they leave the window.
+        min, max    Monotonic queues of row indices: each row is queued and dropped at most once.
+
+    Non-finite values (e.g. viscosity at zero strain rate) are stored, but left out of the
+    statistics.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import thread as td
+from collections import deque
+
+# 3rd Party
+import numpy as np
+
+live_fields = ["omega", "gamma_dot", "tau", "mu", "T", "Vms", "Ims", "dc"]
+
+
+class live_buffer(object):
+    '''
+    Usage:
+
+    object = livebuf.live_buffer(**kwargs)
+
+    Keeps the last (span) seconds of rows, with statistics over the last (window) seconds.
+
+    **kwargs:
+        fields      (list, string)  Name of each value in a row. Default is livebuf.live_fields: omega
+                                    (rad/s), gamma_dot (1/s), tau (Pa), mu (Pa.s), T (celsius), Vms (V),
+                                    Ims (A) and dc (%)
+        span        (float)         Length of history kept (s). Default is 10
+        window      (float)         Length of the statistics window (s); at most span. Default is 1
+        rate        (float)         Expected rows per second, used to size the buffer. Default is 100
+    '''
+
+    def __init__(self, fields=live_fields, span=10.0, window=1.0, rate=100.0):
+        '''
+        object = livebuf.live_buffer(**kwargs)
+
+        Keeps the last (span) seconds of rows, with statistics over the last (window) seconds.
+
+        **kwargs:
+            fields      (list, string)  Name of each value in a row. Default is livebuf.live_fields: omega
+                                        (rad/s), gamma_dot (1/s), tau (Pa), mu (Pa.s), T (celsius), Vms (V),
+                                        Ims (A) and dc (%)
+            span        (float)         Length of history kept (s). Default is 10
+            window      (float)         Length of the statistics window (s); at most span. Default is 1
+            rate        (float)         Expected rows per second, used to size the buffer. Default is 100
+        '''
+        self.fields = list(fields)
+        self.index = dict((f, i) for i, f in enumerate(self.fields))
+        self.span = float(span)
+        self.window = min(float(window), self.span)
+
+        # power of two, with room for rows coming in faster than expected
+        length = 1
+        while length < 2 * span * rate: length *= 2
+        self.length = length
+        self.mask = length - 1
+
+        n = len(self.fields)
+        self.times = np.zeros(length)
+        self.values = np.zeros((length, n))
+        self.lock = td.allocate_lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        live_buffer.clear()
+
+        Empties the buffer.
+        '''
+        n = len(self.fields)
+        with self.lock:
+            self.head = 0  # rows added
+            self.span_tail = 0  # first row in the span
+            self.win_tail = 0  # first row in the window
+            self.sums = np.zeros(n)
+            self.sums2 = np.zeros(n)
+            self.counts = np.zeros(n, np.int64)
+            self.min_q = [deque() for f in self.fields]
+            self.max_q = [deque() for f in self.fields]
+
+    def push(self, t, row):
+        '''
+        live_buffer.push(t, row)
+
+        Adds a row.
+
+        Parameters:
+            t           (float)         Time of the row (s).
+            row         (list, float)   One value for each field.
+        '''
+        v = np.array(row, np.float64)
+        ok = np.isfinite(v)
+        v0 = np.where(ok, v, 0.0)
+        with self.lock:
+            i = self.head
+            slot = i & self.mask
+
+            # rows coming in faster than the buffer was sized for: the row in this slot leaves first
+            while self.win_tail <= i - self.length:
+                self.remove(self.win_tail)
+                self.win_tail += 1
+            while self.span_tail <= i - self.length:
+                self.span_tail += 1
+
+            self.times[slot] = t
+            self.values[slot] = v
+            self.sums += v0
+            self.sums2 += v0 * v0
+            self.counts += ok
+            for k in np.flatnonzero(ok):
+                x = v[k]
+                q = self.min_q[k]
+                while q and self.values[q[-1] & self.mask, k] >= x: q.pop()
+                q.append(i)
+                q = self.max_q[k]
+                while q and self.values[q[-1] & self.mask, k] <= x: q.pop()
+                q.append(i)
+            self.head = i + 1
+
+            # rows leaving the window
+            start = t - self.window
+            while self.win_tail < i and self.times[self.win_tail & self.mask] < start:
+                self.remove(self.win_tail)
+                self.win_tail += 1
+
+            start = t - self.span
+            while self.span_tail < i and self.times[self.span_tail & self.mask] < start:
+                self.span_tail += 1
+
+            # running sums are redone from the window now and then, so rounding errors don't build up
+            if (i & self.mask) == self.mask: self.resum()
+
+    def remove(self, j):
+        v = self.values[j & self.mask]
+        ok = np.isfinite(v)
+        v0 = np.where(ok, v, 0.0)
+        self.sums -= v0
+        self.sums2 -= v0 * v0
+        self.counts -= ok
+        for q in self.min_q + self.max_q:
+            if q and q[0] == j: q.popleft()
+
+    def resum(self):
+        idx = np.arange(self.win_tail, self.head) & self.mask
+        v = self.values[idx]
+        ok = np.isfinite(v)
+        v0 = np.where(ok, v, 0.0)
+        self.sums = np.sum(v0, axis=0)
+        self.sums2 = np.sum(v0 * v0, axis=0)
+        self.counts = np.sum(ok, axis=0)
+
+    def stats(self, field=None):
+        '''
+        live_buffer.stats(**kwargs)
+
+        Gets the statistics of the rows in the window.
+
+        **kwargs:
+            field       (string)        Field to get. Default is every field.
+
+        Returns:
+            stats       (dict)          {"mean", "std", "min", "max", "n"} for the field, or field: that dict
+                                        for every field. NaN where the window has no finite values.
+        '''
+        with self.lock:
+            if field is not None: return self.field_stats(self.index[field])
+            return dict((f, self.field_stats(k)) for k, f in enumerate(self.fields))
+
+    def field_stats(self, k):
+        n = self.counts[k]
+        if n == 0:
+            nan = float('nan')
+            return {"mean": nan, "std": nan, "min": nan, "max": nan, "n": 0}
+        mean = self.sums[k] / n
+        var = max(self.sums2[k] / n - mean * mean, 0.0)
+        return {"mean": mean, "std": var ** 0.5, "n": int(n),
+                "min": self.values[self.min_q[k][0] & self.mask, k],
+                "max": self.values[self.max_q[k][0] & self.mask, k]}
+
+    def mean(self, field):
+        '''
+        live_buffer.mean(field)
+
+        Mean of a field over the window; NaN if there are no finite values.
+        '''
+        k = self.index[field]
+        with self.lock:
+            n = self.counts[k]
+            return self.sums[k] / n if n else float('nan')
+
+    def latest(self):
+        '''
+        live_buffer.latest()
+
+        Returns:
+            t           (float)         Time of the most recent row; None if empty.
+            row         (dict)          field: value of the most recent row.
+        '''
+        with self.lock:
+            if self.head == 0: return None, dict()
+            slot = (self.head - 1) & self.mask
+            return self.times[slot], dict(zip(self.fields, self.values[slot]))
+
+    def get_span(self, field=None):
+        '''
+        live_buffer.get_span(**kwargs)
+
+        Copies out every row in the span, oldest first (e.g. for plotting).
+
+        **kwargs:
+            field       (string)        Field to get. Default is every field.
+
+        Returns:
+            times       (array)         Time of each row (s).
+            values      (array)         Values, shape (rows,) for one field or (rows, fields).
+        '''
+        with self.lock:
+            idx = np.arange(self.span_tail, self.head) & self.mask
+            times = self.times[idx]
+            if field is None: return times, self.values[idx]
+            return times, self.values[idx, self.index[field]]
+
+if __name__ == "__main__":
+    print __doc__
+    print live_buffer.__doc__
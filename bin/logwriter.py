@@ -0,0 +1,225 @@
+'''
+    Writes log rows to file from a background thread.
+
+    The acquisition thread pushes rows onto a bounded queue and carries on; a writer thread
+    drains the queue in batches and hands them to a sink (binlog.binlog_writer, or csv_writer
+    below). A stalled disk then only fills the queue, rather than delaying the next reading.
+    If the queue does fill, new rows are dropped and counted. If the sink fails (e.g. the disk is
+    full), the writer stops, the sink is closed, and the error is warned about and kept (see
+    log_writer.get_stats()).
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import time
+import thread as td
+import Queue
+from warnings import warn
+
+
+class csv_writer(object):
+    '''
+    Usage:
+
+    object = logwriter.csv_writer(path, columns, row_fmt)
+
+    Creates a new text log file at (path), and writes the column names as the first line.
+
+    Parameters:
+        path        (string)        Path of the new log file.
+        columns     (list, string)  Column names.
+        row_fmt     (string)        Format string for a single row, including the line ending.
+    '''
+
+    def __init__(self, path, columns, row_fmt):
+        self.path = path
+        self.columns = list(columns)
+        self.row_fmt = row_fmt
+        self.f = open(path, "w")
+        self.f.write(",".join(self.columns) + "\n")
+
+    def write_row(self, row):
+        self.f.write(self.row_fmt.format(*row))
+
+    def write_rows(self, rows):
+        fmt = self.row_fmt.format
+        self.f.write("".join([fmt(*r) for r in rows]))
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class log_writer(object):
+    '''
+    Usage:
+
+    object = logwriter.log_writer(sink, **kwargs)
+
+    Starts a writer thread which passes queued rows to (sink) in batches.
+
+    Parameters:
+        sink            (object)        Anything with write_rows(rows), flush() and close() methods.
+
+    **kwargs:
+        max_queue       (integer)       Maximum number of rows waiting to be written. Default is 10000
+        batch_size      (integer)       Maximum number of rows handed to the sink at once. Default is 1000
+        drain_interval  (float)         Time the writer waits between emptying the queue (s). Default is 0.1
+        flush_interval  (float)         Time between flushes of the sink to disk (s). Default is 1.0
+    '''
+
+    def __init__(self, sink, max_queue=10000, batch_size=1000, drain_interval=0.1, flush_interval=1.0):
+        '''
+        object = logwriter.log_writer(sink, **kwargs)
+
+        Starts a writer thread which passes queued rows to (sink) in batches.
+
+        Parameters:
+            sink            (object)        Anything with write_rows(rows), flush() and close() methods.
+
+        **kwargs:
+            max_queue       (integer)       Maximum number of rows waiting to be written. Rows pushed while
+                                            the queue is full are dropped. Default is 10000
+            batch_size      (integer)       Maximum number of rows handed to the sink at once. Default is 1000
+            drain_interval  (float)         Time the writer waits between emptying the queue (s). Default is 0.1
+            flush_interval  (float)         Time between flushes of the sink to disk (s). Default is 1.0
+        '''
+        self.sink = sink
+        self.queue = Queue.Queue(max_queue)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.drain_interval = drain_interval
+        self.flush_interval = flush_interval
+
+        self.dropped = 0  # rows lost because the queue was full
+        self.written = 0  # rows handed to the sink
+        self.max_depth = 0  # deepest the queue has been when drained
+        self.error = None  # exception raised by the sink, which stopped the writer
+
+        self.running = True
+        self.finished = False
+        td.start_new_thread(self.run, tuple())
+
+    def push(self, row):
+        '''
+        log_writer.push(row)
+
+        Queues a row to be written. Never blocks; if the queue is full, or the writer has stopped on an
+        error, the row is dropped.
+
+        Parameters:
+            row         (tuple)         The row to write.
+        '''
+        if self.error is not None:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(row)
+        except Queue.Full:
+            self.dropped += 1
+
+    def depth(self):
+        '''
+        log_writer.depth()
+
+        Returns the number of rows currently waiting to be written.
+        '''
+        return self.queue.qsize()
+
+    def drain(self):
+        '''
+        log_writer.drain()
+
+        Passes everything currently in the queue to the sink, in batches of at most batch_size rows.
+        '''
+        depth = self.queue.qsize()
+        if depth > self.max_depth: self.max_depth = depth
+
+        get = self.queue.get_nowait
+        while True:
+            batch = list()
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(get())
+            except Queue.Empty:
+                pass
+            if batch:
+                try:
+                    self.sink.write_rows(batch)
+                except Exception:
+                    self.dropped += len(batch) + self.queue.qsize()
+                    raise
+                self.written += len(batch)
+            if len(batch) < self.batch_size:
+                break
+
+    def run(self):
+        '''
+        log_writer.run()
+
+        When the log_writer is created, a thread is created running this method. Periodically drains
+        the queue and flushes the sink, until log_writer.close() is called or the sink raises an error.
+        '''
+        try:
+            last_flush = time.time()
+            while self.running:
+                time.sleep(self.drain_interval)
+                self.drain()
+                now = time.time()
+                if (now - last_flush) >= self.flush_interval:
+                    self.sink.flush()
+                    last_flush = now
+            self.drain()
+            self.sink.flush()
+        except Exception as e:
+            self.error = e
+            self.running = False
+            warn("Log writing stopped, rows will be dropped: {}".format(e))
+        finally:
+            try:
+                self.sink.close()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                    warn("Could not close log: {}".format(e))
+            self.finished = True
+
+    def close(self, timeout=10.0):
+        '''
+        log_writer.close(**kwargs)
+
+        Stops the writer thread once the queue has been written out, and closes the sink. Warns if the
+        writer hasn't finished within the timeout.
+
+        **kwargs:
+            timeout     (float)         Maximum time to wait for the queue to be written (s). Default is 10
+
+        Returns:
+            finished    (bool)          True if the writer finished, and the log was closed, in time.
+        '''
+        self.running = False
+        end = time.time() + timeout
+        while not self.finished and time.time() < end:
+            time.sleep(0.01)
+        if not self.finished:
+            warn("Log writer did not finish within {} s; {} rows still queued".format(timeout, self.depth()))
+        return self.finished
+
+    def get_stats(self):
+        '''
+        log_writer.get_stats()
+
+        Returns:
+            stats       (dict)          Current queue depth, maximum depth seen, the number of rows written
+                                        and dropped, and the error which stopped the writer (None if it
+                                        hasn't failed).
+        '''
+        return {"queue_depth": self.depth(), "max_depth": self.max_depth, "max_queue": self.max_queue,
+                "written": self.written, "dropped": self.dropped, "error": self.error}
+
+if __name__ == "__main__":
+    print __doc__
+    print log_writer.__doc__
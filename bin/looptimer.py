@@ -0,0 +1,151 @@
+'''
+    Deadline based loop timing, with live measurement of how well the timing is kept.
+
+    Rather than sleeping for a fixed time after the work is done (so that the period becomes
+    work time + sleep time + OS jitter), each iteration is scheduled against an absolute
+    deadline. Lateness, work time and the achieved interval are histogrammed as the loop runs.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import time
+
+# 3rd Party
+import numpy as np  # for histograms
+
+clock = time # source of time() and sleep(); replaced by simhw.py to run against a simulated rig
+
+
+class loop_timer(object):
+    '''
+    Usage:
+
+    object = looptimer.loop_timer(period, **kwargs)
+
+    Creates a deadline based timer for a loop which should run every (period) seconds.
+
+    Parameters:
+        period          (float)         Target time between iterations, in seconds.
+
+    **kwargs:
+        n_bins          (integer)       Number of histogram bins. Default is 100
+        hist_range      (float)         Upper limit of the histograms, in seconds. Default is 2 * period
+    '''
+
+    def __init__(self, period, n_bins=100, hist_range=None):
+        '''
+        object = looptimer.loop_timer(period, **kwargs)
+
+        Creates a deadline based timer for a loop which should run every (period) seconds.
+
+        Parameters:
+            period          (float)         Target time between iterations, in seconds.
+
+        **kwargs:
+            n_bins          (integer)       Number of histogram bins. Default is 100
+            hist_range      (float)         Upper limit of the histograms, in seconds. Values above
+                                            this are counted in the last bin. Default is 2 * period
+        '''
+        self.period = float(period)
+        self.n_bins = n_bins
+        if hist_range is None: hist_range = 2.0 * self.period
+        self.hist_range = float(hist_range)
+        self.bin_width = self.hist_range / n_bins
+        self.reset()
+
+    def reset(self):
+        '''
+        loop_timer.reset()
+
+        Clears all statistics and restarts the schedule from now.
+        '''
+        self.deadline = clock.time()
+        self.last_wake = None
+        self.iterations = 0
+        self.missed = 0
+
+        # running sums for mean/std
+        self.sums = {"jitter": [0.0, 0.0, 0.0], "latency": [0.0, 0.0, 0.0], "interval": [0.0, 0.0, 0.0]}
+        self.counts = {"jitter": 0, "latency": 0, "interval": 0}
+        self.hists = dict()
+        for k in self.sums:
+            self.hists[k] = np.zeros(self.n_bins, np.int64)
+
+    def record(self, key, value):
+        '''
+        loop_timer.record(key, value)
+
+        Adds a measurement to the running statistics and histogram named by key.
+        '''
+        s = self.sums[key]
+        s[0] += value
+        s[1] += value * value
+        if value > s[2]: s[2] = value
+        self.counts[key] += 1
+
+        b = int(value / self.bin_width)
+        if b >= self.n_bins: b = self.n_bins - 1
+        elif b < 0: b = 0
+        self.hists[key][b] += 1
+
+    def wait(self):
+        '''
+        loop_timer.wait()
+
+        Sleeps until the next deadline. Should be called once per iteration, at the top of the loop.
+
+        If the loop has overrun by one or more whole periods, the missed deadlines are counted and
+        skipped so that the schedule keeps its phase rather than trying to catch up.
+
+        Returns:
+            wake        (float)         Time at which the iteration started.
+        '''
+        now = clock.time()
+        if self.last_wake is not None:
+            self.record("latency", now - self.last_wake)
+
+        self.deadline += self.period
+        delay = self.deadline - now
+        if delay > 0:
+            clock.sleep(delay)
+            now = clock.time()
+        elif -delay >= self.period:
+            missed = int(-delay / self.period)
+            self.missed += missed
+            self.deadline += missed * self.period
+
+        self.record("jitter", now - self.deadline)
+        if self.last_wake is not None:
+            self.record("interval", now - self.last_wake)
+        self.last_wake = now
+        self.iterations += 1
+        return now
+
+    def get_stats(self):
+        '''
+        loop_timer.get_stats()
+
+        Summarises the timing of the loop so far.
+
+        Returns:
+            stats       (dict)          Iteration and missed deadline counts, plus the mean, standard
+                                        deviation, maximum and histogram for each of 'jitter' (lateness
+                                        of wake up), 'latency' (work time per iteration) and 'interval'
+                                        (time between successive iterations).
+        '''
+        stats = {"period": self.period, "iterations": self.iterations, "missed": self.missed,
+                 "bin_width": self.bin_width}
+        for k, s in self.sums.items():
+            n = self.counts[k]
+            if n:
+                mean = s[0] / n
+                std = max(s[1] / n - mean * mean, 0.0) ** 0.5
+            else:
+                mean = std = 0.0
+            stats[k] = {"mean": mean, "std": std, "max": s[2], "hist": self.hists[k].copy()}
+        return stats
+
+if __name__ == "__main__":
+    print __doc__
+    print loop_timer.__doc__
@@ -14,6 +14,7 @@ import sys
 import time
 import os
 import thread as td
+import ctypes
 from warnings import warn
 
 # 3rd Party
@@ -29,9 +30,16 @@ import numpy as np
 #from dig_pot import MCP4131 as dp
 from adc import MCP3008 as ac
 from control import pid_controller as pid
-from tempsens import ds18b20 as ts
+from tempsens import temp_service, w1_bus
+from looptimer import loop_timer
+from speedest import speed_estimator
+from binlog import binlog_writer
+from logwriter import log_writer, csv_writer
+from livebuf import live_buffer
 import dproc
 
+clock = time # source of time() and sleep(); replaced by simhw.py to run against a simulated rig
+
 class motor(object):
     '''
     Usage:
@@ -44,20 +52,38 @@ class motor(object):
         startnow        (bool)          Start polling as soon as the instance is created
         adc_vref        (float)         Voltage reference value. Default is 3.3
         poll_logging    (bool)          Indicates whether to log to file or not. Default is True.
-        therm_sn        (string)        Serial number of the thermocouple. Used in 1-wire communication.
-                                        Default is '28-0316875e09ff'
+        therm_sn        (string)        Serial number of the main temperature sensor (logged as 'T'). Every other
+                                        sensor on the 1-wire bus is logged too. Default is '28-0316875e09ff'
         i_poll_rate     (float)         Inverse poll rate: time to wait in between logging data. Default is 0.1
         pic_tuning      (float, float)  Tuning of PI controller. Kp and Ki respectively. Default is (0.2, 0.15)
         relay_pin       (integer)       Pin number which can be used to control the relay.
+        log_format      (string)        'bin' for binary logs (see binlog.py) or 'csv'. Default is 'bin'
+        log_queue_len   (integer)       Maximum number of rows waiting to be written to file. Default is 10000
+        log_flush_interval (float)      Time between flushes of the log file to disk (s). Default is 1.0
+        speed_method    (string)        How the speed is estimated: 'period', 'window', 'blend' or 'last'. Default 
+                                        is 'blend'
+        control_interval (float)        Period of the control loop (s). Default is 0.01
+        realtime        (bool)          Run the control loop with SCHED_FIFO priority (needs root). Default is False
+        live_span       (float)         Length of processed readings kept in motor.live (s). Default is 10
+        live_window     (float)         Window of the statistics of motor.live (s). Default is 1
+        speed_filter    (object)        Streaming filter (see filter.py) for the speed used by the control loop.
+                                        Default is None (unfiltered)
     '''
     # Logging
     poll_running = False  # is the speed currently being polled?
     poll_logging = True  # Will log every (i_poll_rate)s if this is True
     this_log_name = ""
+    logf = None  # logwriter.log_writer for the current log
     debug = False
+    log_columns = ["t", "spd0", "spd1", "spd2", "spd3", "spd4", "spd5", "Vcr", "adc0", "dc", "T", "Vpz", "Vms"]
+    #                   t       spd0   spd1    spd2    spd3    spd4    spd5    cra    adc0     dc      T     Vpz  Vms
+    csv_row_fmt = "{:.6f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {}, {:.3f} \n"
 
     def __init__(self, startnow=False, adc_vref=3.3, poll_logging=True, therm_sn="28-0316875e09ff",
-                 log_interval=0.01, tuning=(1.8, 2.845, 0.0), opt_pins=[21]):
+                 log_interval=0.01, tuning=(1.8, 2.845, 0.0), opt_pins=[21], log_format="bin",
+                 log_queue_len=10000, log_flush_interval=1.0, speed_method="blend",
+                 control_interval=0.01, realtime=False, live_span=10.0, live_window=1.0,
+                 speed_filter=None):
         '''
         object = motor.motor(**kwargs)
         
@@ -67,11 +93,34 @@ class motor(object):
             startnow        (bool)          Start polling as soon as the instance is created. Default is False
             adc_vref        (float)         Voltage reference value. Default is 3.3
             poll_logging    (bool)          Indicates whether to log to file or not. Default is True.
-            therm_sn        (string)        Serial number of the thermocouple. Used in 1-wire communication.
-                                            Default is '28-0316875e09ff'
+            therm_sn        (string)        Serial number of the main temperature sensor (logged as 'T'). Every
+                                            other sensor found on the 1-wire bus is read too, and logged as 'T<i>'
+                                            with the time of the reading as 'tT<i>', in the order of
+                                            motor.temps.sensors (the main sensor first). Default is '28-0316875e09ff'
             i_poll_rate     (float)         Inverse poll rate: time to wait in between logging data. Default is 0.1
             pic_tuning      (float, float)  Tuning of PI controller. Kp and Ki respectively. Default is (0.2, 0.15)
             relay_pin       (integer)       Pin number which can be used to control the relay. Default is 18
+            log_format      (string)        'bin' for binary logs (fixed width records, see binlog.py) or 'csv' for 
+                                            text. Default is 'bin'
+            log_queue_len   (integer)       Maximum number of rows waiting to be written to file. Rows logged while 
+                                            the queue is full are dropped (and counted). Default is 10000
+            log_flush_interval (float)      Time between flushes of the log file to disk (s). Default is 1.0
+            speed_method    (string)        How the speed is estimated (see speedest.py): 'period' (mean period over 
+                                            the last few edges), 'window' (edges counted over a fixed time), 'blend'
+                                            (period at low speed, window at high speed) or 'last' (the last accepted 
+                                            period of each channel). Default is 'blend'
+            control_interval (float)        Period of the control loop (s). Iterations are scheduled against absolute
+                                            deadlines, so the period doesn't grow with the work done. Default is 0.01
+            realtime        (bool)          Run the control loop thread with SCHED_FIFO priority, to reduce jitter. 
+                                            Needs root; a warning is given if it can't be set. Default is False
+            live_span       (float)         Length of processed readings (speed, strain rate, stress, viscosity etc.)
+                                            kept in motor.live (see livebuf.py) (s). Default is 10
+            live_window     (float)         Window over which motor.live keeps the mean, std, min and max (s). 
+                                            Default is 1
+            speed_filter    (object)        Streaming filter for the speed (rad/s) used by the control loop, e.g.
+                                            filter.stream_median(5) to remove spikes from missed encoder edges;
+                                            anything with update(sample) and reset() methods (see filter.py). 
+                                            Default is None (unfiltered)
         '''
         # Debug status string
         self.dss = ""
@@ -79,28 +128,45 @@ class motor(object):
         # GPIO setup
         self.gpio_ready = False
         self.opt_pins = opt_pins
+        self.speed_method = speed_method
         self.setup_gpio()
         
-        # controller
-        self.pidc = pid(tuning)
+        # controller; works in rad/s, with the gains (given per unit strain rate) scaled to match. So pidc.tuning
+        # is in % duty per rad/s (and pidc.lerr in rad/s): set gains with motor.set_tuning(), not on pidc
+        self.strain_setpoint = 0.0
+        self.pidc = pid(self.omega_tuning(tuning))
+        self.set_tuning(tuning)
+        dproc.cal.add_listener(self.update_geometry)
         self.speed = 0.0
         self.control_stopped = True
+        self.control_timer = loop_timer(control_interval)
+        self.speed_filter = speed_filter
+        self.realtime = realtime
+        self.rt_priority = 50
 
         # Set sensor variables
-        self.aconv = ac(cs_pin=1, vref=adc_vref)
-        self.therm = ts(therm_sn)
+        self.aconv = ac(cs_pin=1, vref=adc_vref, persistent=True)
         self.log_interval = log_interval
+        self.poll_timer = loop_timer(log_interval)
         self.volts = [0.0] * 8
-        self.thermo_running = True
-        self.temperature_c = 0.0
         self.temp_c_interval = 0.5
+        bus = w1_bus()
+        sensors = [therm_sn] + [sn for sn in bus.sernos if sn != therm_sn]
+        self.temps = temp_service(sensors, interval=self.temp_c_interval, bus=bus)
+        
+        # Processed readings, for display
+        self.fill_volume_ml = 15.0
+        self.live = live_buffer(span=live_span, window=live_window, rate=1.0 / log_interval)
         
         # Set up logs
         self.poll_logging = poll_logging
+        self.log_format = log_format
+        self.log_ext = log_format
+        self.log_queue_len = log_queue_len
+        self.log_flush_interval = log_flush_interval
         
         # Start threads
         if (startnow): self.start_poll(log_name)
-        td.start_new_thread(self.thermometer, tuple())
     
     def setup_gpio(self):
         if self.gpio_ready: return
@@ -115,45 +181,159 @@ class motor(object):
         self.pwm_er.start(0.0)
         
         # Setup optical encoder pins
-        self.thens    = [time.time()] * (len(self.opt_pins) * 2)
+        self.thens    = [clock.time()] * (len(self.opt_pins) * 2)
         self.rps      = [4.0] * len(self.opt_pins)
         self.rps.extend(self.rps)
         self.speeds   = [0.0] * (len(self.opt_pins) * 2)
         self.misses   = [0] * (len(self.opt_pins) * 2)
         self.t_misses = 10 # how many "incorrect" values to ignore before accepting
         self.opt_dict = dict()
+        self.pin_idx  = np.zeros(64, np.int64) # opt_dict as an array, for looking up a batch of edges at once
+        
+        # Edge ring buffer: written only by opt_fr, read only by process_edges
+        self.edge_buf_len = 4096 # must be a power of two
+        self.edge_mask = self.edge_buf_len - 1
+        self.edge_t   = np.zeros(self.edge_buf_len, np.float64)
+        self.edge_pin = np.zeros(self.edge_buf_len, np.int64)
+        self.edge_lvl = np.zeros(self.edge_buf_len, np.int64)
+        self.edge_head = 0 # edges recorded
+        self.edge_tail = 0 # edges processed
+        self.edges_lost = 0 # edges overwritten before they were processed
+        self.edges_coalesced = 0 # edges too close to the previous to be real (bounce)
+        self.min_edge_dt = 1e-5
+        self.edge_lock = td.allocate_lock()
+        self.speed_est = speed_estimator(self.rps, method=("blend" if self.speed_method == "last" else self.speed_method))
 
         for p in self.opt_pins:
             self.opt_dict[p] = len(self.opt_dict)
+            self.pin_idx[p] = self.opt_dict[p]
             gpio.setup(p, gpio.IN, pull_up_down=gpio.PUD_UP)
             gpio.add_event_detect(p, gpio.BOTH, callback=self.opt_fr)
         gpio.setwarnings(False)
         self.gpio_ready = True
 
     def opt_fr(self, channel):
-        ch_idx = self.opt_dict[channel]
-        if gpio.input(channel): ch_idx += len(self.opt_pins)
-        now = time.time()
-        dt = now - self.thens[ch_idx]
-        prov_spd = (60.0) / (dt * self.rps[ch_idx]) # speed in rpm
-        if ((prov_spd < (2 * self.speeds[ch_idx])) or (self.misses[ch_idx] > self.t_misses)):
-            self.speeds[ch_idx] = prov_spd
-            self.misses[ch_idx] = 0
-        else:
-            self.misses[ch_idx] += 1
-        self.thens[ch_idx] = now
-        #print "ch: ", channel, "idx:", ch_idx
+        '''
+        motor.opt_fr(channel)
+        
+        GPIO edge callback for the optical encoder pins. Only records the edge (pin, level and time) in a
+        preallocated ring buffer; speeds are calculated from the buffer by motor.process_edges().
+        '''
+        now = clock.time()
+        i = self.edge_head & self.edge_mask
+        self.edge_t[i] = now
+        self.edge_pin[i] = channel
+        self.edge_lvl[i] = gpio.input(channel)
+        self.edge_head += 1
+    
+    def process_edges(self):
+        '''
+        motor.process_edges()
+        
+        Takes the edges recorded by opt_fr since the last call, and updates the speed of each encoder channel.
+        Periods and provisional speeds for the whole batch are calculated at once.
+        
+        Provisional speeds are accepted if less than twice the channel's speed at the start of the batch. Once
+        more than t_misses provisional speeds in a row have been rejected, the latest is accepted regardless.
+        '''
+        with self.edge_lock:
+            head = self.edge_head
+            n = head - self.edge_tail
+            if n <= 0: return
+            if n > self.edge_buf_len:
+                self.edges_lost += n - self.edge_buf_len
+                n = self.edge_buf_len
+            idx = np.arange(head - n, head) & self.edge_mask
+            self.edge_tail = head
+            
+            t = self.edge_t[idx]
+            ch = self.pin_idx[self.edge_pin[idx]] + (self.edge_lvl[idx] != 0) * len(self.opt_pins)
+            
+            for c in np.unique(ch):
+                tc = t[ch == c]
+                
+                # drop edges too soon after the one before
+                real = np.diff(np.concatenate([[self.thens[c]], tc])) > self.min_edge_dt
+                self.edges_coalesced += len(tc) - np.count_nonzero(real)
+                tc = tc[real]
+                if len(tc) == 0: continue
+                self.speed_est.add(c, tc)
+                
+                dt = np.diff(np.concatenate([[self.thens[c]], tc]))
+                prov_spd = (60.0) / (dt * self.rps[c]) # speed in rpm
+                accepted = np.flatnonzero(prov_spd < (2 * self.speeds[c]))
+                if len(accepted):
+                    self.speeds[c] = float(prov_spd[accepted[-1]])
+                    self.misses[c] = len(prov_spd) - 1 - accepted[-1]
+                else:
+                    self.misses[c] += len(prov_spd)
+                if self.misses[c] > self.t_misses:
+                    self.speeds[c] = float(prov_spd[-1])
+                    self.misses[c] = 0
+                self.thens[c] = tc[-1]
+    
+    def get_edge_stats(self):
+        '''
+        motor.get_edge_stats()
+        
+        Returns:
+            stats       (dict)              Number of encoder edges recorded, waiting to be processed, lost (overwritten 
+                                            before being processed) and coalesced (too close to the previous edge).
+        '''
+        return {"edges": self.edge_head, "pending": self.edge_head - self.edge_tail, "lost": self.edges_lost,
+                "coalesced": self.edges_coalesced}
     
     def get_speed(self):
-        return np.average(self.speeds)
+        '''
+        motor.get_speed()
         
-    def thermometer(self):
-        while (self.thermo_running):
-            if self.therm.check_sn(): 
-                self.temperature_c = self.therm.read_temp()
-            else:
-                self.thermo_running = False
-            time.sleep(self.temp_c_interval)
+        Gets the speed of the motor, estimated as set by speed_method.
+        
+        Returns:
+            speed       (float)             Speed in rpm.
+        '''
+        self.process_edges()
+        if self.speed_method == "last":
+            return np.average(self.speeds)
+        with self.edge_lock:
+            return self.speed_est.speed(now=clock.time())[0]
+    
+    def get_speed_estimate(self, method=None):
+        '''
+        motor.get_speed_estimate(**kwargs)
+        
+        Gets the speed of the motor along with the variance of the estimate.
+        
+        **kwargs:
+            method      (string)            'period', 'window' or 'blend'. Default is speed_method (or 'blend').
+        
+        Returns:
+            speed       (float)             Speed in rpm.
+            var         (float)             Variance of the estimate (rpm^2).
+        '''
+        self.process_edges()
+        with self.edge_lock:
+            return self.speed_est.speed(method, now=clock.time())
+        
+    @property
+    def temperature_c(self):
+        '''
+        Latest temperature reading (celsius), or 0 if the sensor hasn't been read yet. Never waits on the
+        sensor; see motor.get_temperature() for the age of the reading.
+        '''
+        return self.temps.get_temp(default=0.0)[0]
+
+    def get_temperature(self):
+        '''
+        motor.get_temperature()
+        
+        Gets the latest temperature reading, which is taken in the background (see tempsens.temp_service).
+        
+        Returns:
+            temp_c      (float)             Temperature (celsius), None if the sensor hasn't been read yet.
+            age         (float)             Time since the reading was taken (s).
+        '''
+        return self.temps.get_temp()
         
     def new_logs(self, log_name="./../logs/log.csv"):
         '''
@@ -161,6 +341,9 @@ class motor(object):
         
         Creates a new set of logs. Useful for running tests one after another.
         
+        Rows are written to file by a background thread (see logwriter.py), so that disk access does not hold up
+        the polling thread.
+        
         **kwargs:
             log_name        (string)            Indicates name of new log file.
         '''
@@ -170,11 +353,46 @@ class motor(object):
         except:
             pass
 
-        # Create log
+        # Create log, with a temperature and reading time for every sensor
         if (self.poll_logging):
             self.this_log_name = str(log_name)
-            self.logf = open(self.this_log_name, "w")
-            self.logf.write("t,spd0,spd1,spd2,spd3,spd4,spd5,Vcr,adc0,dc,T,Vpz,Vms\n")
+            n_temps = len(self.temps.sensors)
+            columns = list(self.log_columns)
+            for i in range(n_temps):
+                # reading times are epoch seconds, which float32 (the binlog default) holds only to ~2 minutes
+                columns.extend(["T{}".format(i), ("tT{}".format(i), "<f8")])
+            if self.log_format == "bin":
+                sink = binlog_writer(self.this_log_name, columns)
+            else:
+                row_fmt = self.csv_row_fmt[:-2] + (", {:.3f}, {:.6f}" * n_temps) + " \n"
+                sink = csv_writer(self.this_log_name, [c if isinstance(c, str) else c[0] for c in columns], row_fmt)
+            self.logf = log_writer(sink, max_queue=self.log_queue_len, flush_interval=self.log_flush_interval)
+
+    def write_log_row(self, row):
+        '''
+        motor.write_log_row(row)
+        
+        Queues a row of data to be written to the log file, in the format chosen by log_format.
+        
+        Parameters:
+            row         (tuple)             One value for each of motor.log_columns, then the temperature and time of
+                                                reading of each sensor in motor.temps.
+        '''
+        self.logf.push(row)
+
+    def get_log_stats(self):
+        '''
+        motor.get_log_stats()
+        
+        Gets the state of the log writing queue.
+        
+        Returns:
+            stats       (dict)              Current and maximum queue depth, the number of rows written and dropped,
+                                            and the error (if any) which stopped the log being written. See
+                                            logwriter.log_writer.get_stats(). Empty if no log has been created.
+        '''
+        if self.logf is None: return dict()
+        return self.logf.get_stats()
 
     def start_poll(self, name="./../logs/log.csv", controlled=False, debug_=False):
         '''
@@ -190,6 +408,8 @@ class motor(object):
         '''
         self.debug = debug_
         self.setup_gpio()
+        self.temps.start()
+        self.live.clear()
         if controlled: self.start_control()
 
         if self.poll_logging:
@@ -208,16 +428,49 @@ class motor(object):
             self.control_stopped = False
             td.start_new_thread(self.control, tuple())
             
+    def omega_tuning(self, tuning):
+        '''
+        motor.omega_tuning(tuning)
+        
+        Converts PID gains which act on strain rate error (1/s) to gains which act on angular speed error (rad/s)
+        for the current cell geometry, so the control loop needn't convert every reading.
+        '''
+        k = dproc.cell.strain_factor
+        return tuple(g * k for g in tuning)
+    
+    def set_tuning(self, tuning):
+        '''
+        motor.set_tuning(tuning)
+        
+        Sets the gains of the speed controller. Gains are given for the strain rate error (1/s), as before, and
+        kept in motor.tuning; the controller works in rad/s, so motor.pidc.tuning holds them scaled for the 
+        current cell geometry (see omega_tuning), and motor.pidc.lerr is the last error in rad/s. The scaled 
+        gains are updated again if the geometry changes.
+        
+        Parameters:
+            tuning      (float, float, float)   Kp, Ki and Kd, acting on the strain rate error.
+        '''
+        self.tuning = tuple(tuning)
+        self.pidc.tuning = self.omega_tuning(self.tuning)
+    
+    def update_geometry(self, store):
+        # calibration store listener (dproc.cal): the cell geometry may have changed, so the gains and set point 
+        # are converted again
+        self.set_tuning(self.tuning)
+        self.pidc.set_point = dproc.cell.omega_for_strain(self.strain_setpoint)
+    
     def update_setpoint(self, value):
         '''
         motor.update_setpoint(value)
         
-        Sets the new setpoint on the controller.
+        Sets the new setpoint on the controller. The strain rate is converted to a speed of the inner cylinder 
+        here, once; the controller then works in rad/s. To change the gains, use motor.set_tuning().
         
         Parameters:
             value       (float)         The strain value for the control system to target, (s^-1).
         '''
-        self.pidc.set_point = value
+        self.strain_setpoint = value
+        self.pidc.set_point = dproc.cell.omega_for_strain(value)
     
     def control(self):
         '''
@@ -227,18 +480,65 @@ class motor(object):
         (filtered) from the sensor detection thread and calculates the control action (new motor supply voltage) to
         best maintain the setpoint.
         
+        Iterations start every control_interval seconds, against absolute deadlines. Latency, jitter and missed 
+        deadlines are available from motor.get_control_stats().
+        
         This will repeat until motor.control_stopped becomes True.
         '''
+        if self.realtime: self.set_realtime(self.rt_priority)
+        self.control_timer.reset()
+        if self.speed_filter is not None: self.speed_filter.reset()
+        last_t = None
         while not self.control_stopped:
+            t = self.control_timer.wait()
+            dt = (t - last_t) if last_t is not None else self.control_timer.period
+            last_t = t
             self.speed = self.get_speed()
             av_speed = (2 * np.pi * self.speed) / 60.0
+            if self.speed_filter is not None: av_speed = self.speed_filter.update(av_speed)
             self.speed_rads = av_speed
-            control_action = self.pidc.get_control_action(dproc.get_strain(av_speed))
-            #control_action = self.pidc.get_control_action(av_speed)
+            control_action = self.pidc.get_control_action(av_speed, dt=dt)
             if control_action > 100.0: control_action = 100.0
             if control_action < 0.0: control_action = 0
             self.set_dc(control_action)
-            time.sleep(0.01)
+
+    def set_realtime(self, priority):
+        '''
+        motor.set_realtime(priority)
+        
+        Gives the calling thread SCHED_FIFO (real-time) scheduling. Requires root.
+        
+        Parameters:
+            priority    (integer)           Real-time priority, 1 (low) to 99 (high).
+        
+        Returns:
+            success     (bool)              Whether the scheduling policy was set.
+        '''
+        try:
+            if hasattr(os, "sched_setscheduler"):
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            else:
+                # not in the os module before python 3.3, go to libc
+                libc = ctypes.CDLL("libc.so.6", use_errno=True)
+                param = ctypes.c_int(priority) # struct sched_param { int sched_priority; }
+                if libc.sched_setscheduler(0, 1, ctypes.byref(param)) != 0: # 1 = SCHED_FIFO
+                    raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        except (OSError, AttributeError) as e:
+            warn("Could not set real-time priority: {}".format(e))
+            return False
+        return True
+
+    def get_control_stats(self):
+        '''
+        motor.get_control_stats()
+        
+        Gets the live timing statistics of the control loop: per-iteration latency (work time), jitter (lateness of
+        each iteration) and missed deadlines, with histograms. See looptimer.loop_timer.get_stats().
+        
+        Returns:
+            stats       (dict)          Timing statistics.
+        '''
+        return self.control_timer.get_stats()
 
     def read_sensors(self):
         '''
@@ -247,12 +547,9 @@ class motor(object):
         Reads from every channel of the ADC (CH0 to CH7).
         
         Returns:
-            out     ([float] * 8)       List of values read from ADC.
+            out     (numpy array)       Array of the 8 values read from ADC.
         '''
-        out = list()
-        for a in range(0, 8):
-            out.append(self.aconv.read_volts(a))
-        return out
+        return self.aconv.read_all_channels()
         
     def poll(self):
         '''
@@ -261,31 +558,62 @@ class motor(object):
         When motor.start_poll() is called, a thread is created running this method. Continuously reads the sensors and 
         writes the values out to the log file.
         
+        Rows are taken against absolute deadlines every log_interval seconds; timing statistics are available
+        from motor.get_poll_stats().
+        
         This will repeat until motor.stop_poll() is called, or motor.poll_running becomes False.
         '''
         self.poll_running = True
+        self.poll_timer.reset()
 	
         while (self.poll_running):
             # At the third tone, the time will be...
-            t = time.time()
+            t = self.poll_timer.wait()
             
             # Read sensors
             self.volts = self.read_sensors()
+            self.process_edges()
             stw = list(self.speeds)
             
-            if len(stw) < 6: stw.extend([3.14] * (6 - len(stw)))
+            if len(stw) < 6: stw.extend([dproc.spd_pad] * (6 - len(stw)))
+            self.push_live(t)
             
             if (self.poll_logging and not self.debug):
-                #                   t       spd0   spd1    spd2    spd3    spd4    spd5    cra    adc0     dc      T     Vpz  Vms
-                self.logf.write(("{:.6f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {:.3f}, {}, {:.3f} \n").format(
-                    t, stw[0], stw[1], stw[2], stw[3], stw[4], stw[5], self.volts[2], self.volts[1], self.ldc, self.temperature_c, self.volts[4], (self.volts[7] * dproc.vmsmult)))
+                self.write_log_row((t, stw[0], stw[1], stw[2], stw[3], stw[4], stw[5], self.volts[2], self.volts[1], self.ldc, 
+                    self.temperature_c, self.volts[4], (self.volts[7] * dproc.vmsmult)) + tuple(self.temps.get_row()))
             elif (self.debug):
-                self.logf.write(("{:.6f}, 80, 80, 80, 80, 80, 80, 3, 0, 50, 15, 2, 3 \n").format(t))
-                    
-            # delay for x seconds
-            time.sleep(self.log_interval)
+                self.write_log_row((t, 80, 80, 80, 80, 80, 80, 3, 0, 50, 15, 2, 3) + tuple(self.temps.get_row()))
         self.clean_exit()
 
+    def push_live(self, t):
+        '''
+        motor.push_live(t)
+        
+        Processes the latest readings (speed, strain rate, stress, viscosity...) and adds them to motor.live. Called 
+        by the polling thread after each reading.
+        
+        Angular acceleration is taken as zero here, as differencing live speed estimates is too noisy; the logs 
+        are processed properly afterwards (dproc.calc_mu).
+        '''
+        omega = self.get_speed() * (2.0 * np.pi / 60.0)
+        vms = self.volts[7] * dproc.vmsmult
+        ims = dproc.get_current(self.volts[2])
+        with np.errstate(divide='ignore', invalid='ignore'): # no viscosity when stopped
+            gd, __, tau, mu = dproc.calc_mu(1, vms, ims, self.fill_volume_ml, omega, dwdt_override=0)
+        self.live.push(t, (omega, gd, tau, mu, self.temperature_c, vms, ims, self.ldc))
+
+    def get_poll_stats(self):
+        '''
+        motor.get_poll_stats()
+        
+        Gets the live timing statistics of the logging loop: sample interval, jitter and overruns. See
+        looptimer.loop_timer.get_stats().
+        
+        Returns:
+            stats       (dict)          Timing statistics.
+        '''
+        return self.poll_timer.get_stats()
+
     def set_dc(self, value):
         '''
         motor.set_dc(value)
@@ -317,17 +645,18 @@ class motor(object):
         self.poll_running = False
         self.control_stopped = True
         self.spf_needed = False
-        self.thermo_running = False
         
         # Stop motor
-        time.sleep(1)
+        clock.sleep(1)
         self.set_dc(0.0)
-        time.sleep(2)
+        clock.sleep(2)
         self.set_dc(0.0)
-        time.sleep(2)        
+        clock.sleep(2)        
         
         # Release GPIO and whatnot
         self.pwm_er.stop()
+        self.aconv.release()
+        self.temps.stop()
         gpio.cleanup()
         self.gpio_ready = False
         
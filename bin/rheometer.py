@@ -11,10 +11,7 @@
 
 debug = False
 
-print "Loading packages.."
-
 ## Included in python...
-print "\tPython packages..."
 import time
 import sys
 import math
@@ -33,13 +30,9 @@ draw_width = int(console_width) - 2
 draw_height = int(console_height) - 2
 
 ## Third party
-print "\t3rd Party Packages..."
+# (pandas, matplotlib, scipy and sympy are only imported when first used, so the menu comes up quickly)
 import numpy as np
-import pandas as pd
 import curses
-import matplotlib
-from sympy.parsing.sympy_parser import parse_expr as pe
-import sympy as sp
 
 try:
     import spidev
@@ -47,13 +40,13 @@ except:
     debug = True
     
 ## RPi-Rheo packages
-print "\tRPi-Rheo Packages"
-from filter import filter as filt_r
 import dproc
 from dproc import fit_line
 from dproc import plot_fit
 from dproc import read_logf
 from motor import motor
+from schedule import compile_schedule
+from looptimer import loop_timer
 
 def linux_distribution():
   try:
@@ -241,12 +234,7 @@ def menu(initsel=0):
             inp_k = True
             
             try:
-                t = 2
-                gd = sp.Symbol('gd')
-                expr = pe(gd_expr) - gd
-                val = sp.solve(expr, gd)
-                if len(val) > 1: raise Exception("you dun entered it rong lol")
-                a = eval(str(sp.solve(expr, gd)[0]))
+                a = compile_schedule(gd_expr)(2)
             except:
                 inp_k = False
                 extra_info = "Input not recognised (ensure it is a function of 't', or a constant)"
@@ -316,7 +304,7 @@ def menu(initsel=0):
         res = display(blurb, options)
 
         if not res:
-            cur_log = "./../logs/ccal_{}.csv".format(time.strftime("%d.%m.%y-%H%M", time.gmtime()))
+            cur_log = "./../logs/ccal_{}.{}".format(time.strftime("%d.%m.%y-%H%M", time.gmtime()), mot.log_ext)
             mot.start_poll(name=cur_log, controlled=False, debug_=debug)
             for i in range(0, len_ccal):
                 dc = (100.0 / (len_ccal - 1)) * i
@@ -363,9 +351,9 @@ def menu(initsel=0):
                 display(blurb, options, input_type=inputs.none_)
                 time.sleep(1)
             mot.clean_exit()
+            from filter import filter as filt_r
             __, st, __, __, __, __, __, __, cra, __, __, __, Vms, __, __, __ = read_logf(cur_log)
-            Vms = filt_r(st, Vms)
-            cra = filt_r(st, cra)
+            Vms, cra = filt_r(st, np.array([Vms, cra]))
             Ims = dproc.get_current(cra)
             blurb = [
                         "Current Calibration",
@@ -380,7 +368,7 @@ def menu(initsel=0):
              "Complete! Plot saved as \"./../plots/cal_cur.png\"",
              "",
              "Previous fit:",
-             "\tIco = Vms * {} + {}".format(dproc.cal_IcoVms[0], dproc.cal_IcoVms[1]),
+             "\tIco = Vms * {} + {}".format(*dproc.cal.get("cal_IcoVms", ["?", "?"])),
              "",
              "New fit:",
              "\tIco = Vms * {} + {}".format(coeffs[0], coeffs[1])]
@@ -389,8 +377,7 @@ def menu(initsel=0):
             res = display(blurb, options)
             
             if res == 0:
-                dproc.cal_IcoVms = coeffs
-                dproc.writeout()
+                dproc.cal.set("cal_IcoVms", coeffs)
             
         ### Part 2: Motor Calibration ###
         blurb = [   "Motor Calibration",
@@ -484,7 +471,7 @@ def menu(initsel=0):
                 
             if res == 1: raise CAE
             
-            ref_log = "./../logs/mcal_{}_{}_{}.csv".format(ref_nams[-1], ref_viscs[-1], time.strftime("%d.%m.%y-%H%M", time.gmtime()))
+            ref_log = "./../logs/mcal_{}_{}_{}.{}".format(ref_nams[-1], ref_viscs[-1], time.strftime("%d.%m.%y-%H%M", time.gmtime()), mot.log_ext)
             
             run_test("newt_ref", cal_len, 125, title="Reference {} Test: {}".format(count, ref_nams[-1]), ln_override=ref_log)
             ref_logs.append(ref_log)
@@ -527,7 +514,7 @@ def mot_cal(ref_logs):
         display(blurb, list(), input_type=inputs.none_)
         __, st, spd0, spd1, spd2, spd3, spd4, spd5, Vcr, adc0, T, Vpz, Vms, gamma_dot, tau, __ = read_logf(ref_logs[i])
         
-        # mcal_[name]_[viscosity]_[date+time].csv
+        # mcal_[name]_[viscosity]_[date+time].[csv/bin]
         v_term = ref_logs[i].split('_')[2]
         try:
             viscosity = float(v_term) # if is any of the 'smart' options, this will not work
@@ -547,7 +534,7 @@ def mot_cal(ref_logs):
             I_EMF[j] = I_MS[j] - I_CO[j]
         I_EMFs.append(np.average(I_EMF))
                 
-        stress = viscosity * np.average(gamma_dot) # pa = pa.s * (1/s)
+        stress = np.average(viscosity * gamma_dot) # pa = pa.s * (1/s)
         torque = dproc.get_torque(stress, 15)
         T_MSs.append(torque)
             
@@ -558,7 +545,7 @@ def mot_cal(ref_logs):
              "Complete! Plot saved as \"./../plots/cal_mot.png\"",
              "",
              "Previous fit:",
-             "\tT = Iemf * {} + {}".format(dproc.cal_TIemf[0], dproc.cal_TIemf[1]),
+             "\tT = Iemf * {} + {}".format(*dproc.cal.get("cal_TIemf", ["?", "?"])),
              "",
              "New fit:",
              "\tT = Iemf * {} + {}".format(mot_cal[0], mot_cal[1])]
@@ -567,23 +554,21 @@ def mot_cal(ref_logs):
     res = display(blurb, options)
             
     if res == 0:
-        dproc.cal_TIemf = mot_cal
-        dproc.writeout()
+        dproc.cal.set("cal_TIemf", mot_cal)
     
 ######################################################################################################################## run_test()
-def run_test(tag, length, gd_expr, title="Rheometry Test", ln_prefix="rheometry_test", ln_override=None):
+def run_test(tag, length, gd_expr, title="Rheometry Test", ln_prefix="rheometry_test", ln_override=None, setpoint_rate=100):
     global mot
-    # Calculate initial GD for warm up
-    gd_expr = str(gd_expr)
-    gd = sp.Symbol('gd')
-    t = 0.0
-    expr = pe(gd_expr) - gd
-    gd_val = eval(str(sp.solve(expr, gd)[0]))
+    dproc.cal.refresh() # pick up any change to the calibration file
+    
+    # Compile strain rate schedule, and calculate initial GD for warm up
+    gd_sched = compile_schedule(gd_expr)
+    gd_val = gd_sched(0.0, mot.temperature_c)
     mot.setup_gpio()
     mot.set_dc(50)
 
     #display([title, "", ""], [""], input_type=inputs.none_)
-    ln = "./../logs/{}_{}_{}.csv".format(ln_prefix, tag, time.strftime("%d%m%y_%H%M", time.gmtime()))
+    ln = "./../logs/{}_{}_{}.{}".format(ln_prefix, tag, time.strftime("%d%m%y_%H%M", time.gmtime()), mot.log_ext)
     if ln_override != None: ln = ln_override
     blurb = [
                         title,
@@ -603,28 +588,39 @@ def run_test(tag, length, gd_expr, title="Rheometry Test", ln_prefix="rheometry_
     set_strain_rate(gd_val)
     time.sleep(3)
 
+    # Setpoint for every update of the run, unless it depends on the (changing) temperature
+    times, gd_table = gd_sched.table(length, setpoint_rate, mot.temperature_c)
+    sp_timer = loop_timer(1.0 / setpoint_rate)
+    
     mot.start_poll(name=ln, controlled=True, debug_=debug)
     
-    for i in range(0, length):
-        gd_expr = str(gd_expr)
-        gd = sp.Symbol('gd')
-        t = float(copy.copy(i))
-        expr = pe(gd_expr) - gd
-        gd_val = eval(str(sp.solve(expr, gd)[0]))
+    sp_timer.reset()
+    for k in range(0, len(times)):
+        sp_timer.wait()
+        if gd_sched.uses_T:
+            gd_val = gd_sched(times[k], mot.temperature_c)
+        else:
+            gd_val = gd_table[k]
         set_strain_rate(gd_val)
         
+        # status only updated once per second
+        if k % setpoint_rate: continue
+        i = int(k // setpoint_rate)
+        
         ## Progress bar
         width = 40
         perc = int(math.ceil((i / float(length)) * width))
         neg_perc = int(math.floor(((float(length) - i) / length) * width))
         
-        ## Status
-        aspd = mot.get_speed()
-        aspd_rads = (aspd * 2 * np.pi) / 60.0
-        dc   = mot.ldc
-        vms  = mot.volts[7] * dproc.vmsmult
-        ims  = dproc.get_current(mot.volts[2])
-        gd, __, tau, mu = dproc.calc_mu(1, vms, ims, 15, aspd_rads, dwdt_override=0)
+        ## Status: averages over the last second of processed readings
+        live = mot.live.stats()
+        aspd_rads = live["omega"]["mean"]
+        dc   = live["dc"]["mean"]
+        vms  = live["Vms"]["mean"]
+        ims  = live["Ims"]["mean"]
+        gd   = live["gamma_dot"]["mean"]
+        tau  = live["tau"]["mean"]
+        mu   = live["mu"]["mean"]
         blurb = [
                 title,
                 "",
@@ -639,7 +635,6 @@ def run_test(tag, length, gd_expr, title="Rheometry Test", ln_prefix="rheometry_
                 ]
         options = [" "]
         display(blurb, options, input_type=inputs.none_)
-        time.sleep(1)
     
     mot.clean_exit()
     
@@ -669,17 +664,12 @@ def set_strain_rate(value):
     if mot.control_stopped:
         mot.set_dc(value / 20) # very very roughly
     else:
-        mot.pidc.set_point = value
+        mot.update_setpoint(value)
 
 def solver_expr(expression, t=0.0, T=None):
     global mot
     if T == None: T = mot.temperature_c
-    expr = str(expression)
-    y = sp.Symbol('y')
-    t = float(copy.copy(t))
-    T = float(copy.copy(T))
-    expr = pe(expr) - y
-    y_val = eval(str(sp.solve(expr, y)[0]))
+    y_val = compile_schedule(expression, var='y')(t, T)
     return y_val
 
 ######################################################################################################################## calculate_viscosity()
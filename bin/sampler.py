@@ -0,0 +1,144 @@
+'''
+    Continuous, fixed rate sampling of MCP3008 ADC channels into a ring buffer.
+
+    Samples are taken against absolute deadlines (see looptimer.py) so that the sample interval
+    does not drift with the time taken to read the ADC. Every sample is timestamped, and the
+    timing statistics are available while sampling is running.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import thread as td
+
+# 3rd Party
+import numpy as np  # for the ring buffer
+
+# RPi-R
+from looptimer import loop_timer
+
+
+class adc_sampler(object):
+    '''
+    Usage:
+
+    object = sampler.adc_sampler(aconv, channels, **kwargs)
+
+    Creates a sampling engine which reads (channels) from the ADC (aconv) at a fixed rate.
+
+    Parameters:
+        aconv           (adc.MCP3008)   The ADC to sample from.
+        channels        (list, integer) ADC channels to read at each sample.
+
+    **kwargs:
+        rate            (float)         Target sample rate in Hz. Default is 1000
+        buffer_len      (integer)       Number of samples held in the ring buffer. Default is 10000
+    '''
+
+    def __init__(self, aconv, channels, rate=1000.0, buffer_len=10000):
+        '''
+        object = sampler.adc_sampler(aconv, channels, **kwargs)
+
+        Creates a sampling engine which reads (channels) from the ADC (aconv) at a fixed rate.
+
+        Parameters:
+            aconv           (adc.MCP3008)   The ADC to sample from. Should be in persistent mode.
+            channels        (list, integer) ADC channels to read at each sample.
+
+        **kwargs:
+            rate            (float)         Target sample rate in Hz. Default is 1000
+            buffer_len      (integer)       Number of samples held in the ring buffer. Once full, the
+                                            oldest samples are overwritten. Default is 10000
+        '''
+        self.aconv = aconv
+        self.channels = list(channels)
+        self.rate = float(rate)
+        self.buffer_len = buffer_len
+
+        self.times = np.zeros(buffer_len, np.float64)
+        self.values = np.zeros((buffer_len, len(self.channels)), np.float64)
+        self.count = 0  # total number of samples taken
+
+        self.timer = loop_timer(1.0 / self.rate)
+        self.lock = td.allocate_lock()
+        self.running = False
+        self.stopped = True
+
+    def start(self):
+        '''
+        adc_sampler.start()
+
+        Starts sampling in a new thread. Does nothing if already running.
+        '''
+        if self.running: return
+        self.running = True
+        self.stopped = False
+        td.start_new_thread(self.run, tuple())
+
+    def stop(self):
+        '''
+        adc_sampler.stop()
+
+        Signals the sampling thread to stop.
+        '''
+        self.running = False
+
+    def run(self):
+        '''
+        adc_sampler.run()
+
+        When adc_sampler.start() is called, a thread is created running this method. Reads the ADC
+        at every deadline and stores the result in the ring buffer.
+
+        This will repeat until adc_sampler.stop() is called.
+        '''
+        self.timer.reset()
+        read = self.aconv.read_channels
+        channels = self.channels
+        while self.running:
+            t = self.timer.wait()
+            v = read(channels)
+            with self.lock:
+                i = self.count % self.buffer_len
+                self.times[i] = t
+                self.values[i] = v
+                self.count += 1
+        self.stopped = True
+
+    def get_latest(self, n=None):
+        '''
+        adc_sampler.get_latest(**kwargs)
+
+        Gets the most recent samples, oldest first.
+
+        **kwargs:
+            n           (integer)       Number of samples to return. Default is all held in the buffer.
+
+        Returns:
+            t           (numpy array)   Sample timestamps, shape (n,).
+            v           (numpy array)   Sample values, shape (n, len(channels)).
+        '''
+        with self.lock:
+            held = min(self.count, self.buffer_len)
+            if n is None or n > held: n = held
+            idx = np.arange(self.count - n, self.count) % self.buffer_len
+            return self.times[idx], self.values[idx]
+
+    def get_stats(self):
+        '''
+        adc_sampler.get_stats()
+
+        Gets the live timing statistics of the sampling loop (see looptimer.loop_timer.get_stats),
+        along with the number of samples taken and overwritten.
+
+        Returns:
+            stats       (dict)          Timing statistics.
+        '''
+        stats = self.timer.get_stats()
+        stats["samples"] = self.count
+        stats["overwritten"] = max(self.count - self.buffer_len, 0)
+        return stats
+
+if __name__ == "__main__":
+    print __doc__
+    print adc_sampler.__doc__
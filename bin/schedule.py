@@ -0,0 +1,116 @@
+'''
+    Compiles setpoint expressions (e.g. strain rate as a function of time) into numpy functions.
+
+    The expression is parsed and solved once with sympy, then turned into a plain numpy function
+    with lambdify, so evaluating it during a run costs microseconds rather than a sympy solve.
+    sympy itself is only imported when the first expression is compiled.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# 3rd Party
+import numpy as np
+
+
+class schedule(object):
+    '''
+    Usage:
+
+    object = schedule.schedule(expression, **kwargs)
+
+    Compiles (expression) into a function of time 't' (s) and temperature 'T' (celsius).
+
+    Parameters:
+        expression      (string)        Expression for the setpoint, e.g. "50 + 2 * t". May also be an
+                                        equation in terms of the setpoint variable, e.g. "gd / 2 + t".
+
+    **kwargs:
+        var             (string)        Name of the setpoint variable. Default is 'gd'
+    '''
+
+    def __init__(self, expression, var="gd"):
+        '''
+        object = schedule.schedule(expression, **kwargs)
+
+        Compiles (expression) into a function of time 't' (s) and temperature 'T' (celsius).
+
+        Raises ValueError if the expression has no single solution for the setpoint, or uses
+        symbols other than 't' and 'T'.
+        '''
+        import sympy as sp
+        from sympy.parsing.sympy_parser import parse_expr as pe
+
+        self.expression = str(expression)
+        self.var = var
+
+        y = sp.Symbol(var)
+        t, T = sp.symbols("t T")
+        solutions = sp.solve(pe(self.expression) - y, y)
+        if len(solutions) != 1:
+            raise ValueError("Expression must have exactly one solution for {}".format(var))
+        self.solution = solutions[0]
+
+        unknown = self.solution.free_symbols - set([t, T])
+        if unknown:
+            raise ValueError("Unknown symbols in expression: {}".format(", ".join(sorted(str(u) for u in unknown))))
+        self.uses_t = t in self.solution.free_symbols
+        self.uses_T = T in self.solution.free_symbols
+
+        self.f = sp.lambdify((t, T), self.solution, "numpy")
+
+    def __call__(self, t, T=20.0):
+        '''
+        schedule(t, **kwargs)
+
+        Evaluates the setpoint.
+
+        Parameters:
+            t           (float/array)   Time(s) since the start of the run (s).
+
+        **kwargs:
+            T           (float/array)   Temperature(s) (celsius). Default is 20
+
+        Returns:
+            value       (float/array)   The setpoint, with the broadcast shape of t and T.
+        '''
+        t = np.asarray(t, np.float64)
+        T = np.asarray(T, np.float64)
+        value = self.f(t, T) + np.zeros(np.broadcast(t, T).shape)
+        return value[()]
+
+    def table(self, length, rate=100.0, T=20.0):
+        '''
+        schedule.table(length, **kwargs)
+
+        Precomputes the setpoint for a whole run.
+
+        Parameters:
+            length      (float)         Length of the run (s).
+
+        **kwargs:
+            rate        (float)         Setpoint updates per second. Default is 100
+            T           (float)         Temperature (celsius). Default is 20
+
+        Returns:
+            times       (array)         Time of each update (s).
+            values      (array)         Setpoint at each update.
+        '''
+        times = np.arange(0.0, length, 1.0 / rate)
+        return times, self(times, T)
+
+compiled = dict()
+
+def compile_schedule(expression, var="gd"):
+    '''
+    compile_schedule(expression, **kwargs)
+
+    As schedule(expression, var=var), but each expression is only compiled once.
+    '''
+    key = (str(expression), var)
+    if key not in compiled:
+        compiled[key] = schedule(expression, var=var)
+    return compiled[key]
+
+if __name__ == "__main__":
+    print __doc__
+    print schedule.__doc__
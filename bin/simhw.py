@@ -0,0 +1,257 @@
+'''
+    Simulated rheometer hardware, for running and benchmarking the acquisition, control and
+    processing code off the Pi.
+
+    A DC motor model (dproc.kv, dproc.R) turns the inner cylinder of the couette cell
+    (dproc.cell) against a fluid of chosen viscosity. The motor is driven by the duty cycle of
+    the PWM pin (read from dummygpio), encoder edges are sent to the registered GPIO callbacks
+    at the angles they'd really occur, and the ADC (through dummyspi) reads the motor current,
+    supply voltage and piezo signal the model gives.
+
+    Time can run faster than real time (for benchmarks) or at real time (for soak tests): the
+    clock the motor and loop timers use is swapped for a scaled one.
+
+    Usage:
+        import simhw
+        from motor import motor
+        rig = simhw.start_rig(speedup=10.0, mu=0.5)
+        mot = motor()
+        ...
+        rig.stop()
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import time
+import thread as td
+
+# 3rd Party
+import numpy as np
+
+# RPi-R
+import dproc
+import dummygpio
+import dummyspi
+import looptimer
+import motor
+
+
+class sim_clock(object):
+    '''
+    Usage:
+
+    object = simhw.sim_clock(**kwargs)
+
+    Drop in for the time module's time() and sleep(), with time running (speedup) times faster
+    than real time. Starts at the real time.
+
+    **kwargs:
+        speedup     (float)         Simulated seconds per real second. Default is 1
+    '''
+
+    def __init__(self, speedup=1.0):
+        self.speedup = float(speedup)
+        self.real_start = time.time()
+
+    def time(self):
+        return self.real_start + (time.time() - self.real_start) * self.speedup
+
+    def sleep(self, seconds):
+        if seconds > 0: time.sleep(seconds / self.speedup)
+
+
+def mu_const(mu):
+    return lambda gamma_dot, T: mu
+
+class rig(object):
+    '''
+    Usage:
+
+    object = simhw.rig(**kwargs)
+
+    Simulates the motor, cell and fluid, and the sensors read by motor.py.
+
+    **kwargs:
+        mu              (float/function) Viscosity (Pa.s), or a function mu(gamma_dot, T) for a non-newtonian
+                                        fluid. Default is 0.01
+        fill_volume_ml  (float)         Volume of fluid in the cell (ml). Default is 15
+        T               (float)         Fluid temperature (celsius). Default is 20
+        supply_V        (float)         Motor supply voltage at 100 % duty (V). Default is 5
+        J_rotor         (float)         Moment of inertia of the motor and coupling (kg m^2), on top of the inner
+                                        cylinder's. Default is 2e-6
+        friction        (float)         Viscous friction of the motor and bearings (Nm/(rad/s)). Default is 2e-7
+        edges_per_rev   (integer)       Encoder edges (rising and falling) per revolution, on each pin. Default is 8
+        pwm_pin         (integer)       PWM output pin driving the motor. Default is 18
+        opt_pins        (list, integer) Encoder pins; each is offset by a fraction of an edge. Default is [21]
+        piezo_gain      (float)         Piezo signal per unit torque (V/Nm), about 1.65 V. Default is 100
+        noise_V         (float)         Standard deviation of noise on each ADC reading (V). Default is 0.005
+        vref            (float)         ADC reference voltage. Default is 3.3
+        step            (float)         Longest integration step (s). Default is 5e-4
+        clock           (object)        Time source, with time() and sleep(). Default is the time module.
+        seed            (integer)       Seed for the ADC noise. Default is None
+    '''
+
+    def __init__(self, mu=0.01, fill_volume_ml=15.0, T=20.0, supply_V=5.0, J_rotor=2e-6, friction=2e-7,
+                 edges_per_rev=8, pwm_pin=18, opt_pins=[21], piezo_gain=100.0, noise_V=0.005, vref=3.3,
+                 step=5e-4, clock=time, seed=None):
+        '''
+        object = simhw.rig(**kwargs)
+
+        Simulates the motor, cell and fluid, and the sensors read by motor.py. See simhw.rig.__doc__ for the
+        keyword arguments.
+        '''
+        self.mu = mu if callable(mu) else mu_const(mu)
+        self.fill_volume_ml = fill_volume_ml
+        self.T = T
+        self.supply_V = supply_V
+        self.J = J_rotor + dproc.I_cyl
+        self.friction = friction
+        self.edge_angle = 2.0 * np.pi / edges_per_rev
+        self.pwm_pin = pwm_pin
+        self.opt_pins = list(opt_pins)
+        self.piezo_gain = piezo_gain
+        self.noise_V = noise_V
+        self.vref = vref
+        self.step = step
+        self.clock = clock
+        self.rng = np.random.RandomState(seed)
+
+        self.t = self.clock.time()
+        self.omega = 0.0 # rad/s
+        self.angle = 0.0 # rad
+        self.Vms = 0.0
+        self.Ims = 0.0
+        self.torque = 0.0 # fluid torque, Nm
+        self.edges = [0] * len(self.opt_pins) # edges sent on each pin
+        self.running = False
+        self.finished = True
+
+    def duty_cycle(self):
+        pwm = dummygpio.pwms.get(self.pwm_pin)
+        if pwm is None: return 0.0
+        return min(max(float(pwm.dc), 0.0), 100.0)
+
+    def advance(self, t):
+        '''
+        rig.advance(t)
+
+        Integrates the model up to time t, in steps of at most rig.step.
+        '''
+        kv, R, cell = dproc.kv, dproc.R, dproc.cell
+        self.Vms = self.supply_V * self.duty_cycle() / 100.0
+        while self.t < t:
+            h = min(self.step, t - self.t)
+            gamma_dot = cell.strain(self.omega)
+            self.torque = cell.torque(self.mu(gamma_dot, self.T) * gamma_dot, self.fill_volume_ml)
+            self.Ims = max((self.Vms - kv * self.omega) / R, 0.0) # freewheel diode: no braking current
+            domega = (kv * self.Ims - self.torque - self.friction * self.omega) / self.J
+            self.omega = max(self.omega + domega * h, 0.0) # the motor is only driven one way
+            self.angle += self.omega * h
+            self.t += h
+
+    def send_edges(self):
+        '''
+        rig.send_edges()
+
+        Toggles each encoder pin for every edge passed since the last call, calling the GPIO callbacks.
+        '''
+        n_pins = len(self.opt_pins)
+        for i, pin in enumerate(self.opt_pins):
+            due = int(self.angle / self.edge_angle - float(i) / n_pins)
+            while self.edges[i] < due:
+                self.edges[i] += 1
+                dummygpio.set_input(pin, self.edges[i] % 2)
+
+    def next_edge_delay(self):
+        if self.omega <= 0: return self.step
+        n_pins = len(self.opt_pins)
+        nxt = min((self.edges[i] + 1 + float(i) / n_pins) * self.edge_angle for i in range(n_pins))
+        return max((nxt - self.angle) / self.omega, 0.0)
+
+    def adc_volts(self, channel):
+        '''
+        rig.adc_volts(channel)
+
+        Voltage on an ADC channel, as wired to the Pi (see motor.poll): CH2 current sensor, CH4 piezo,
+        CH7 motor supply voltage (through the divider, dproc.vmsmult).
+        '''
+        if channel == 2: v = 2.5 + 0.185 * self.Ims
+        elif channel == 4: v = 0.5 * self.vref + self.piezo_gain * self.torque
+        elif channel == 7: v = self.Vms / dproc.vmsmult
+        else: v = 0.0
+        return v + self.rng.normal(0.0, self.noise_V)
+
+    def adc_counts(self, channel):
+        '''
+        rig.adc_counts(channel)
+
+        10-bit reading of an ADC channel (for dummyspi).
+        '''
+        counts = int(round(self.adc_volts(channel) / self.vref * 1023.0))
+        return min(max(counts, 0), 1023)
+
+    def run(self):
+        '''
+        rig.run()
+
+        When rig.start() is called, a thread is created running this method. Advances the model with the clock,
+        sleeping until the next encoder edge is due (or at most rig.step), until rig.stop() is called.
+        '''
+        while self.running:
+            self.advance(self.clock.time())
+            self.send_edges()
+            self.clock.sleep(min(self.next_edge_delay(), self.step))
+        self.finished = True
+
+    def start(self):
+        '''
+        rig.start()
+
+        Attaches the rig to the dummy ADC and starts the simulation thread.
+        '''
+        if self.running: return
+        dummyspi.backend = self
+        self.t = self.clock.time()
+        self.running = True
+        self.finished = False
+        td.start_new_thread(self.run, tuple())
+
+    def stop(self, timeout=1.0):
+        '''
+        rig.stop(**kwargs)
+
+        Stops the simulation thread and detaches the rig from the dummy ADC.
+        '''
+        self.running = False
+        end = time.time() + timeout
+        while not self.finished and time.time() < end:
+            time.sleep(0.001)
+        if dummyspi.backend is self: dummyspi.backend = None
+
+def start_rig(speedup=1.0, **kwargs):
+    '''
+    start_rig(**kwargs)
+
+    Makes the motor and loop timers use a (possibly sped up) simulated clock, and starts a simulated rig on it.
+    Must be used off the Pi (motor using dummygpio).
+
+    **kwargs:
+        speedup     (float)         Simulated seconds per real second. Default is 1 (real time)
+        (others)                    Passed on to rig.
+
+    Returns:
+        rig         (rig)           The running rig.
+    '''
+    if motor.gpio is not dummygpio:
+        raise RuntimeError("The simulated rig can only be used without RPi.GPIO")
+    clock = sim_clock(speedup)
+    motor.clock = clock
+    looptimer.clock = clock
+    sim = rig(clock=clock, **kwargs)
+    sim.start()
+    return sim
+
+if __name__ == "__main__":
+    print __doc__
+    print rig.__doc__
@@ -0,0 +1,227 @@
+'''
+    Speed estimation from optical encoder edge times.
+
+    Three estimators are kept up to date for each encoder channel, each costing O(1) per edge:
+
+        period      Mean period over the last N edges. Precise at low speed, but lags at high speed
+                    as N edges cover less time.
+        window      Number of edges in a fixed time window. Lag is fixed by the window, but the
+                    reading is quantised to whole edges, which is coarse at low speed.
+        blend       Period estimate at low speed, window estimate at high speed, with a linear
+                    blend between the two in the switching region.
+
+    Each estimate is returned along with an estimate of its variance.
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import time
+
+# 3rd Party
+import numpy as np
+
+
+class edge_estimator(object):
+    '''
+    Usage:
+
+    object = speedest.edge_estimator(edges_per_rev, **kwargs)
+
+    Estimates the speed of a single encoder channel from its edge times.
+
+    Parameters:
+        edges_per_rev   (float)         Number of edges seen by this channel each revolution.
+
+    **kwargs:
+        n_edges         (integer)       Number of periods averaged by the period estimator. Default is 8
+        window          (float)         Time window of the edge counting estimator (s). Default is 0.25
+        blend_low       (float)         Below this speed (rpm), the blend estimator uses the period estimate
+                                        only. Default is 1500
+        blend_high      (float)         Above this speed (rpm), the blend estimator uses the window estimate
+                                        only. Default is 3000
+        buffer_len      (integer)       Number of edge times kept; must be a power of two, and enough to hold
+                                        a full window at top speed. Default is 1024
+    '''
+
+    def __init__(self, edges_per_rev, n_edges=8, window=0.25, blend_low=1500.0, blend_high=3000.0, buffer_len=1024):
+        self.edges_per_rev = float(edges_per_rev)
+        self.n_edges = n_edges
+        self.window = float(window)
+        self.blend_low = float(blend_low)
+        self.blend_high = float(blend_high)
+
+        self.buffer_len = buffer_len
+        self.mask = buffer_len - 1
+        self.times = [0.0] * buffer_len
+        self.head = 0  # edges added
+        self.win_tail = 0  # first edge inside the counting window
+
+        # running sums of the last n_edges periods
+        self.sum_p = 0.0
+        self.sum_p2 = 0.0
+
+    def period(self, i):
+        '''Time between edge i and the edge before it.'''
+        return self.times[i & self.mask] - self.times[(i - 1) & self.mask]
+
+    def add(self, t):
+        '''
+        edge_estimator.add(t)
+
+        Adds the time of a new edge.
+        '''
+        i = self.head
+        self.times[i & self.mask] = t
+        self.head = i + 1
+        if i == 0: return
+
+        p = self.period(i)
+        self.sum_p += p
+        self.sum_p2 += p * p
+        j = i - self.n_edges
+        if j >= 1:
+            q = self.period(j)
+            self.sum_p -= q
+            self.sum_p2 -= q * q
+
+    def add_many(self, ts):
+        '''
+        edge_estimator.add_many(ts)
+
+        Adds the times of a number of new edges, oldest first.
+        '''
+        add = self.add
+        for t in ts:
+            add(t)
+
+    def period_speed(self, now):
+        '''
+        edge_estimator.period_speed(now)
+
+        Speed from the mean period over the last n_edges edges. If the current (unfinished) period is
+        already longer than that, it is used instead, so the estimate falls when the motor stops.
+
+        Returns:
+            rpm         (float)         Speed estimate (rpm).
+            var         (float)         Variance of the estimate (rpm^2).
+        '''
+        n = min(self.head - 1, self.n_edges)
+        if n < 1: return 0.0, 0.0
+        last = self.head - 1
+        span = self.times[last & self.mask] - self.times[(last - n) & self.mask]
+        ongoing = now - self.times[(last - n + 1) & self.mask]
+        if ongoing > span: span = ongoing
+        if span <= 0: return 0.0, 0.0
+
+        rpm = 60.0 * n / (span * self.edges_per_rev)
+        mean_p = self.sum_p / n
+        var_p = max(self.sum_p2 / n - mean_p * mean_p, 0.0)
+        var = ((rpm / mean_p) ** 2) * var_p / n if mean_p > 0 else 0.0
+        return rpm, var
+
+    def window_speed(self, now):
+        '''
+        edge_estimator.window_speed(now)
+
+        Speed from the number of edges in the last (window) seconds. The variance is that of the +/- 1 edge
+        quantisation at each end of the window.
+
+        Returns:
+            rpm         (float)         Speed estimate (rpm).
+            var         (float)         Variance of the estimate (rpm^2).
+        '''
+        start = now - self.window
+        if self.win_tail < self.head - self.buffer_len:
+            self.win_tail = self.head - self.buffer_len
+        while self.win_tail < self.head and self.times[self.win_tail & self.mask] <= start:
+            self.win_tail += 1
+
+        per_edge = 60.0 / (self.window * self.edges_per_rev)
+        return (self.head - self.win_tail) * per_edge, (per_edge ** 2) / 6.0
+
+    def blend_speed(self, now):
+        '''
+        edge_estimator.blend_speed(now)
+
+        Period estimate below blend_low, window estimate above blend_high, linearly blended between.
+
+        Returns:
+            rpm         (float)         Speed estimate (rpm).
+            var         (float)         Variance of the estimate (rpm^2).
+        '''
+        p_rpm, p_var = self.period_speed(now)
+        if p_rpm <= self.blend_low: return p_rpm, p_var
+        w_rpm, w_var = self.window_speed(now)
+        if p_rpm >= self.blend_high: return w_rpm, w_var
+        w = (p_rpm - self.blend_low) / (self.blend_high - self.blend_low)
+        return (1.0 - w) * p_rpm + w * w_rpm, ((1.0 - w) ** 2) * p_var + (w ** 2) * w_var
+
+    def speed(self, method="blend", now=None):
+        '''
+        edge_estimator.speed(**kwargs)
+
+        **kwargs:
+            method      (string)        'period', 'window' or 'blend'. Default is 'blend'
+            now         (float)         Time of the estimate. Default is time.time()
+
+        Returns:
+            rpm         (float)         Speed estimate (rpm).
+            var         (float)         Variance of the estimate (rpm^2).
+        '''
+        if now is None: now = time.time()
+        if method == "period": return self.period_speed(now)
+        if method == "window": return self.window_speed(now)
+        if method == "blend": return self.blend_speed(now)
+        raise ValueError("Unknown speed estimation method: {}".format(method))
+
+
+class speed_estimator(object):
+    '''
+    Usage:
+
+    object = speedest.speed_estimator(edges_per_rev, **kwargs)
+
+    Estimates the speed from a number of encoder channels, as the average of each channel's estimate.
+
+    Parameters:
+        edges_per_rev   (list, float)   Number of edges per revolution for each channel.
+
+    **kwargs:
+        method          (string)        Default estimator: 'period', 'window' or 'blend'. Default is 'blend'
+        (others)                        Passed on to edge_estimator for every channel.
+    '''
+
+    def __init__(self, edges_per_rev, method="blend", **kwargs):
+        self.method = method
+        self.channels = [edge_estimator(e, **kwargs) for e in edges_per_rev]
+
+    def add(self, channel, ts):
+        '''
+        speed_estimator.add(channel, ts)
+
+        Adds the times (oldest first) of new edges seen on a channel.
+        '''
+        self.channels[channel].add_many(ts)
+
+    def speed(self, method=None, now=None):
+        '''
+        speed_estimator.speed(**kwargs)
+
+        **kwargs:
+            method      (string)        'period', 'window' or 'blend'. Default is speed_estimator.method
+            now         (float)         Time of the estimate. Default is time.time()
+
+        Returns:
+            rpm         (float)         Average speed estimate of all channels (rpm).
+            var         (float)         Variance of the average, treating channels as independent (rpm^2).
+        '''
+        if method is None: method = self.method
+        if now is None: now = time.time()
+        ests = np.array([c.speed(method, now) for c in self.channels])
+        n = len(ests)
+        return float(np.average(ests[:, 0])), float(np.sum(ests[:, 1]) / (n * n))
+
+if __name__ == "__main__":
+    print __doc__
+    print speed_estimator.__doc__
@@ -0,0 +1,313 @@
+'''
+    Offline plant identification and controller tuning.
+
+    Fits a first or second order plus dead time model of the motor (duty cycle in, strain rate out)
+    to the 'dc' and speed columns of existing logs, then searches for PID gains against that model
+    in simulation (see control.pid_controller.simulate). This replaces tuning against the live
+    motor (etc/auto_tune.py, etc/tuner.py) with a few seconds of computation.
+
+    Fits which can't describe the motor (negative gain, a dead time or time constant longer than
+    the logs, or a least squares search that didn't converge) are rejected with a ModelFitError.
+
+    Usage:
+        python sysid.py [--order 2] LOG [LOG ...]
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import sys
+import argparse
+
+# 3rd Party
+import numpy as np
+from scipy.optimize import leastsq
+from scipy.signal import lfilter
+
+# RPi-R
+import dproc
+from control import pid_controller
+
+
+def load_io(log_n, dt=None):
+    '''
+    load_io(log_n, **kwargs)
+
+    Reads the input (PWM duty cycle, %) and output (strain rate, 1/s) of the motor from a log, resampled
+    onto a uniform time base. Rows with unreasonable speeds (> 4000 rpm) are ignored.
+
+    **kwargs:
+        dt          (float)             Sample time to resample to (s). Default is the median interval of the log.
+
+    Returns:
+        st          (array)             Time since the start of the log (s).
+        u           (array)             Duty cycle (%).
+        y           (array)             Strain rate (1/s).
+    '''
+    chunks = list(dproc.iter_logf(log_n, columns=["t", "dc"] + dproc.spd_columns))
+    t = np.concatenate([c["t"] for c in chunks])
+    dc = np.concatenate([c["dc"] for c in chunks])
+    spds = np.array([np.concatenate([c[n] for c in chunks]) for n in dproc.spd_columns])
+
+    spds = dproc.active_speeds(spds)
+    keep = np.all(spds <= 4000.0, axis=0)
+    t, dc, spds = t[keep], dc[keep], spds[:, keep]
+    if len(t) <= 9: raise dproc.LogTooShortError
+
+    y = dproc.get_strain(np.average(spds, axis=0) * (2.0 * np.pi / 60.0))
+    st = t - t[0]
+    if dt is None: dt = np.median(np.diff(st))
+    stu = np.arange(0.0, st[-1], dt)
+    return stu, np.interp(stu, st, dc), np.interp(stu, st, y)
+
+class ModelFitError(Exception):
+    '''Occurs when a fitted model can't describe the motor (see fit_model)'''
+
+    def __init__(self, model, problems):
+        self.model = model
+        self.problems = problems
+
+    def __str__(self):
+        return "Poor model fit ({}): {}".format(self.model, "; ".join(self.problems))
+
+def first_order(x, a, y0=0.0):
+    '''
+    first_order(x, a, **kwargs)
+
+    Response of the discrete first order lag y[k+1] = a * y[k] + (1 - a) * x[k], starting from y0.
+    '''
+    return lfilter([0.0, 1.0 - a], [1.0, -a], x, zi=[a * y0])[0]
+
+class pdt_model(object):
+    '''
+    Usage:
+
+    object = sysid.pdt_model(params, **kwargs)
+
+    A first or second order plus dead time model:
+
+        y = max(x, 0),  x = K * G(s) * exp(-theta * s) * u + b,  G(s) = 1 / ((tau1 s + 1)(tau2 s + 1))
+
+    where a first order model has no tau2.
+
+    Parameters:
+        params      (list, float)       [K, tau1, theta, b] or [K, tau1, theta, b, tau2]
+    '''
+
+    def __init__(self, params):
+        self.params = [float(p) for p in params]
+        self.order = 2 if len(self.params) > 4 else 1
+
+    def __str__(self):
+        p = self.params
+        s = "K = {:.4g} (1/s)/%, tau1 = {:.4g} s, theta = {:.4g} s, b = {:.4g} 1/s".format(p[0], abs(p[1]), abs(p[2]), p[3])
+        if self.order == 2: s += ", tau2 = {:.4g} s".format(abs(p[4]))
+        return s
+
+    def response(self, st, u):
+        '''
+        pdt_model.response(st, u)
+
+        Simulates the model output for the input u sampled at uniform times st.
+        '''
+        dt = st[1] - st[0]
+        K, tau1, theta, b = self.params[:4]
+        ud = np.interp(st - abs(theta), st, u, left=u[0])
+        x = first_order(K * ud, np.exp(-dt / max(abs(tau1), 1e-6)))
+        if self.order == 2:
+            x = first_order(x, np.exp(-dt / max(abs(self.params[4]), 1e-6)))
+        return np.maximum(x + b, 0.0)
+
+    def plant(self, dt):
+        '''
+        pdt_model.plant(dt)
+
+        Creates a plant object for use with pid_controller.simulate, with time step dt.
+        '''
+        return pdt_plant(self, dt)
+
+class pdt_plant(object):
+    '''
+    Usage:
+
+    object = sysid.pdt_plant(model, dt)
+
+    Steps a pdt_model for many simulations at once (see control.pid_controller.simulate). The dead time
+    is rounded to whole time steps.
+    '''
+
+    def __init__(self, model, dt):
+        self.model = model
+        self.dt = dt
+        self.delay = int(round(abs(model.params[2]) / dt))
+        self.a = [np.exp(-dt / max(abs(tau), 1e-6)) for tau in [model.params[1]] + model.params[4:5]]
+
+    def reset(self, n):
+        self.x = [np.zeros(n) for a in self.a]
+        self.u_hist = np.zeros((self.delay + 1, n))
+        self.k = 0
+        return self.output()
+
+    def output(self):
+        return np.maximum(self.x[-1] + self.model.params[3], 0.0)
+
+    def step(self, u, dt):
+        self.u_hist[self.k % (self.delay + 1)] = u
+        self.k += 1
+        x_in = self.model.params[0] * self.u_hist[self.k % (self.delay + 1)]
+        for i, a in enumerate(self.a):
+            self.x[i] = a * self.x[i] + (1.0 - a) * x_in
+            x_in = self.x[i]
+        return self.output()
+
+def fit_model(logs, order=1, dt=None, check=True):
+    '''
+    fit_model(logs, **kwargs)
+
+    Fits a first or second order plus dead time model to one or more logs, by least squares.
+
+    A fit is rejected if the gain is not positive, the dead time or a time constant is longer than
+    the longest log, or the least squares search did not converge.
+
+    Parameters:
+        logs        (list, string)      Paths to the logs to fit.
+
+    **kwargs:
+        order       (integer)           1 or 2. Default is 1
+        dt          (float)             Sample time to resample the logs to (s). Default is the median interval
+                                        of each log.
+        check       (bool)              Raise a ModelFitError if the fit is rejected. Default is True
+
+    Returns:
+        model       (pdt_model)         The fitted model.
+        rms         (float)             RMS error of the fit (1/s).
+        r2          (float)             Coefficient of determination (R^2) of the fit.
+    '''
+    data = [load_io(ln, dt) for ln in logs]
+
+    # initial guess: gain from the average ratio of output to input
+    u_all = np.concatenate([d[1] for d in data])
+    y_all = np.concatenate([d[2] for d in data])
+    K0 = np.sum(y_all * u_all) / max(np.sum(u_all * u_all), 1e-12)
+    params = [K0, 0.5, 0.05, 0.0]
+    if order == 2: params.append(0.1)
+
+    def residual(params):
+        m = pdt_model(params)
+        return np.concatenate([m.response(st, u) - y for st, u, y in data])
+
+    params, cov, info, mesg, ier = leastsq(residual, params, full_output=True)
+    model = pdt_model(params)
+    res = residual(params)
+    rms = np.sqrt(np.mean(res ** 2))
+    r2 = 1.0 - np.sum(res ** 2) / max(np.sum((y_all - np.mean(y_all)) ** 2), 1e-12)
+
+    if check:
+        problems = list()
+        duration = max(d[0][-1] for d in data)
+        if ier not in [1, 2, 3, 4]: problems.append("least squares did not converge ({})".format(mesg.strip()))
+        if model.params[0] <= 0.0: problems.append("gain is not positive")
+        if abs(model.params[2]) >= duration: problems.append("dead time is longer than the logs")
+        if any(abs(tau) >= duration for tau in [model.params[1]] + model.params[4:5]):
+            problems.append("time constant is longer than the logs")
+        if problems: raise ModelFitError(model, problems)
+    return model, rms, r2
+
+def tuning_cost(y, u, setpoints, dt, effort_weight=0.01):
+    '''
+    tuning_cost(y, u, setpoints, dt, **kwargs)
+
+    Integral of time-weighted absolute error (restarted at every set point change), plus a penalty on the
+    total variation of the control action. Works on arrays of simulations, one per row.
+    '''
+    changes = np.flatnonzero(np.diff(setpoints)) + 1
+    starts = np.zeros(len(setpoints), np.int64)
+    starts[changes] = changes
+    starts = np.maximum.accumulate(starts)
+    t = (np.arange(len(setpoints)) - starts) * dt
+
+    scale = max(np.max(np.abs(setpoints)), 1e-12)
+    itae = np.sum(t * np.abs(setpoints - y), axis=-1) * dt / scale
+    effort = np.sum(np.abs(np.diff(u, axis=-1)), axis=-1) / 100.0
+    return itae + effort_weight * effort
+
+def tune(model, dt=0.01, setpoints=None, n_random=4000, n_refine=4, bounds=((0.01, 20.0), (0.01, 50.0), (0.0, 1.0)),
+         seed=None):
+    '''
+    tune(model, **kwargs)
+
+    Searches for PID gains which give good set point tracking against a model, in simulation. A random
+    (log-uniform) search over the bounds is followed by a number of rounds of narrower searches around the
+    best tuning so far; every round is simulated in one call to pid_controller.simulate.
+
+    Parameters:
+        model       (pdt_model)         Plant model (e.g. from fit_model).
+
+    **kwargs:
+        dt          (float)             Control loop period (s). Default is 0.01
+        setpoints   (array)             Strain rate set point at each step. Default is a step to 70% of the
+                                        model's strain rate at full duty cycle for 5 s, then to 30% of it for 5 s.
+        n_random    (integer)           Number of tunings in each round. Default is 4000
+        n_refine    (integer)           Number of refining rounds. Default is 4
+        bounds      (tuple)             (min, max) for each of Kp, Ki and Kd. Default is ((0.01, 20), (0.01, 50),
+                                        (0, 1))
+        seed        (integer)           Random seed. Default is None
+
+    Returns:
+        tuning      (float, float, float) The best (Kp, Ki, Kd) found; suitable for motor(tuning=...).
+        cost        (float)             The cost of that tuning (see tuning_cost).
+    '''
+    rng = np.random.RandomState(seed)
+    if setpoints is None:
+        K, b = model.params[0], model.params[3]
+        y_max = K * 100.0 + b
+        if y_max <= 0.0: raise ValueError("Model can't reach a positive strain rate ({}); give the setpoints".format(model))
+        n = int(round(5.0 / dt))
+        setpoints = np.concatenate([np.full(n, 0.7 * y_max), np.full(n, 0.3 * y_max)])
+    setpoints = np.asarray(setpoints, np.float64)
+
+    lo = np.array([max(b[0], 1e-4) for b in bounds])
+    hi = np.array([b[1] for b in bounds])
+    tunings = np.exp(rng.uniform(np.log(lo), np.log(hi), (n_random, 3)))
+    tunings[rng.uniform(size=n_random) < 0.5, 2] = 0.0 # plenty of PI candidates
+
+    pid = pid_controller((0.0, 0.0, 0.0))
+    best, best_cost = None, np.inf
+    spread = 1.0
+    for r in range(n_refine + 1):
+        with np.errstate(all='ignore'):
+            y, u = pid.simulate(model.plant(dt), setpoints, dt, tunings=tunings)
+            cost = tuning_cost(y, u, setpoints, dt)
+        cost[~np.isfinite(cost)] = np.inf # unstable tunings
+        i = np.argmin(cost)
+        if cost[i] < best_cost:
+            best, best_cost = tunings[i].copy(), cost[i]
+
+        # next round: log-normal scatter around the best
+        spread *= 0.5
+        tunings = best * np.exp(rng.normal(0.0, spread, (n_random, 3)))
+        tunings = np.clip(tunings, [b[0] for b in bounds], hi)
+        tunings[0] = best
+    return tuple(float(g) for g in best), float(best_cost)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fits a plant model to motor logs, and tunes the PID controller against it.")
+    parser.add_argument("logs", nargs="+", help="log files (.csv or binary) with 'dc' and speed columns")
+    parser.add_argument("--order", type=int, default=1, choices=[1, 2], help="model order (default 1)")
+    parser.add_argument("--dt", type=float, default=0.01, help="control loop period, s (default 0.01)")
+    args = parser.parse_args()
+
+    print "Fitting model..."
+    try:
+        model, rms, r2 = fit_model(args.logs, order=args.order)
+    except ModelFitError as e:
+        print "\t{}".format(e.model)
+        print "\tFit rejected: {}".format("; ".join(e.problems))
+        sys.exit(1)
+    print "\t{}".format(model)
+    print "\tRMS error: {:.4g} 1/s, R^2 = {:.4f}".format(rms, r2)
+
+    print "Tuning..."
+    tuning, cost = tune(model, dt=args.dt)
+    print "\ttuning = ({:.4g}, {:.4g}, {:.4g})".format(*tuning)
+    print "\tcost: {:.4g}".format(cost)
@@ -2,55 +2,370 @@
 # tempsens.py
 #
 # class controlling the DS18B20 1-wire temperature sensor from a Raspberry Pi
-# 
+#
 # Taken (almost verbatim) from:
 # https://www.modmypi.com/blog/ds18b20-one-wire-digital-temperature-sensor-and-the-raspberry-pi
 #
 # Feels a bit silly, I'd rather directly control the sensor but w/e
 #
+# Reading a sensor blocks for ~750 ms while the kernel waits on the conversion, so
+# temp_service (below) does the reading in the background, and callers get the last
+# good reading (and its age) straight away. w1_bus finds every sensor on the bus and
+# has them all convert at once with one bulk conversion, where the kernel supports
+# it (therm_bulk_read). Otherwise the sensors are read one after another: the kernel
+# holds the bus for the whole of each w1_slave read, so reading from more threads
+# doesn't overlap the conversions.
+#
 # Requires root
 
 import os
 import sys
+import time
 import platform
+import thread as td
+from glob import glob
+
+w1_devices = '/sys/bus/w1/devices'
+w1_modules = [('w1-gpio', '/sys/module/w1_gpio'), ('w1-therm', '/sys/module/w1_therm')]
+ds18b20_family = '28'
+
+
+def load_modules():
+    # loads 1 wire drivers, if they aren't already (modprobe costs a subprocess, and a sudo)
+    if platform.system() == "Windows": return
+    for module, path in w1_modules:
+        if not os.path.isdir(path):
+            os.system('sudo -H modprobe {}'.format(module))
+
+
+def parse_w1_slave(text):
+    # w1_slave holds two lines, e.g.:
+    #   72 01 4b 46 7f ff 0e 10 57 : crc=57 YES
+    #   72 01 4b 46 7f ff 0e 10 57 t=23125
+    # returns the temperature in celsius, or None if the CRC check failed.
+    lines = text.splitlines()
+    if len(lines) < 2 or lines[0].strip()[-3:] != 'YES': return None
+    temp_output = lines[1].find('t=')
+    if temp_output == -1: return None
+    return float(lines[1].strip()[temp_output+2:]) / 1000.0
 
 
 class ds18b20(object):
 
     def __init__(self, serno):
-        # loads 1 wire drivers
-        if platform.system() == "Windows":
-            self.on_windows = True
-        else:
-            self.on_windows = False
-            os.system('sudo -H modprobe w1-gpio')
-            os.system('sudo -H modprobe w1-therm')
-            self.sens_file = '/sys/bus/w1/devices/{}/w1_slave'.format(serno)
+        self.on_windows = platform.system() == "Windows"
+        load_modules()
+        self.fds = dict()
+        self.set_sn(serno)
 
     def temp_raw(self):
-        
+
         f = open(self.sens_file, 'r')
         lines = f.readlines()
         f.close()
         return lines
 
+    def read_attr(self, name):
+        # the sysfs file is kept open and re-read from the start, which has the
+        # kernel produce the value again without another open() each time.
+        fd = self.fds.get(name)
+        if fd is None:
+            fd = self.fds[name] = os.open('{}/{}/{}'.format(w1_devices, self.serno, name), os.O_RDONLY)
+        os.lseek(fd, 0, os.SEEK_SET)
+        return os.read(fd, 256)
+
+    def read_once(self):
+        # one conversion. returns None if the CRC check failed.
+        if self.on_windows: return 20.0
+        return parse_w1_slave(self.read_attr('w1_slave'))
+
+    def read_converted(self):
+        # result of the last bulk conversion (see w1_bus), in celsius
+        if self.on_windows: return 20.0
+        return float(self.read_attr('temperature')) / 1000.0
+
     def read_temp(self):
         if self.on_windows: return 20.0
-        
-        lines = self.temp_raw()
-        while lines[0].strip()[-3:] != 'YES':
+
+        temp_c = self.read_once()
+        while temp_c is None:
             time.sleep(0.2)
-            lines = self.temp_raw()
-    
-        temp_output = lines[1].find('t=')
-
-        if temp_output != -1:
-            temp_string = lines[1].strip()[temp_output+2:]
-            temp_c = float(temp_string) / 1000.0
-            return temp_c
-    
+            temp_c = self.read_once()
+        return temp_c
+
     def set_sn(self, serno):
-        self.sens_file = '/sys/bus/w1/devices/{}/w1_slave'.format(serno)
-    
+        self.close()
+        self.serno = serno
+        self.sens_file = '{}/{}/w1_slave'.format(w1_devices, serno)
+
     def check_sn(self):
+        if self.on_windows: return True
         return os.path.isfile(self.sens_file)
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = dict()
+
+
+def read_sensor(sens):
+    # ds18b20.read_once(), with IO errors as failed readings
+    try:
+        return sens.read_once()
+    except (IOError, OSError):
+        sens.close()
+        return None
+
+
+class w1_bus(object):
+    '''
+    Usage:
+
+    object = tempsens.w1_bus(**kwargs)
+
+    Finds the DS18B20 sensors on the 1-wire bus, and reads them all at once.
+
+    **kwargs:
+        bulk            (bool)          Use bulk conversion if the kernel supports it. Default is True
+    '''
+
+    def __init__(self, bulk=True):
+        '''
+        object = tempsens.w1_bus(**kwargs)
+
+        Finds the DS18B20 sensors on the 1-wire bus, and reads them all at once.
+
+        **kwargs:
+            bulk            (bool)          Use bulk conversion if the kernel supports it. Default is True
+        '''
+        load_modules()
+        self.discover()
+        self.bulk = bulk and len(self.bulk_files) > 0 and len(self.bulk_files) == len(self.masters)
+
+    def discover(self):
+        '''
+        w1_bus.discover()
+
+        Lists the bus masters and the DS18B20 sensors on them.
+
+        Returns:
+            sernos      (list, string)  Serial numbers of the sensors found.
+        '''
+        self.masters = sorted(glob('{}/w1_bus_master*'.format(w1_devices)))
+        self.bulk_files = [m + '/therm_bulk_read' for m in self.masters if os.path.isfile(m + '/therm_bulk_read')]
+        self.sernos = [os.path.basename(p) for p in sorted(glob('{}/{}-*'.format(w1_devices, ds18b20_family)))]
+        return self.sernos
+
+    def bulk_convert(self, timeout=2.0):
+        # starts a conversion on every sensor at once, and waits for it to finish:
+        # therm_bulk_read reads -1 while any sensor is still converting.
+        for path in self.bulk_files:
+            with open(path, 'w') as f:
+                f.write('trigger\n')
+        time.sleep(0.75)
+        end = time.time() + timeout
+        for path in self.bulk_files:
+            while True:
+                with open(path, 'r') as f:
+                    if f.read().strip() != '-1': break
+                if time.time() > end: raise IOError('Timed out waiting for 1-wire bulk conversion')
+                time.sleep(0.01)
+
+    def convert(self, sensors):
+        '''
+        w1_bus.convert(sensors)
+
+        Reads a list of sensors, with all of the conversions done at once where the kernel can do a
+        bulk conversion, or else one sensor after another.
+
+        Parameters:
+            sensors     (list, ds18b20) Sensors to read.
+
+        Returns:
+            temps       (list, float)   Temperature (celsius) of each sensor, None where the reading failed.
+        '''
+        if len(sensors) == 0: return list()
+        if self.bulk:
+            try:
+                self.bulk_convert()
+            except (IOError, OSError):
+                return [None] * len(sensors)
+            temps = list()
+            for sens in sensors:
+                try:
+                    temps.append(sens.read_converted())
+                except (IOError, OSError, ValueError):
+                    sens.close()
+                    temps.append(None)
+            return temps
+
+        return [read_sensor(sens) for sens in sensors]
+
+
+class temp_service(object):
+    '''
+    Usage:
+
+    object = tempsens.temp_service(**kwargs)
+
+    Reads a number of DS18B20 sensors in the background, from a single thread. Each round, every
+    sensor is read (see w1_bus.convert). The latest good reading of each is available
+    instantly from temp_service.get_temp().
+
+    **kwargs:
+        sensors         (list, string)  Serial numbers of the sensors to read. Default is every sensor
+                                        found on the bus.
+        interval        (float)         Time between the start of each round of readings (s). A round
+                                        takes ~750 ms, so this is a minimum. Default is 1.0
+        startnow        (bool)          Start the reading thread straight away. Default is True
+        bus             (w1_bus)        Bus to read the sensors on. Default is a new w1_bus.
+    '''
+
+    def __init__(self, sensors=None, interval=1.0, startnow=True, bus=None):
+        '''
+        object = tempsens.temp_service(**kwargs)
+
+        Reads a number of DS18B20 sensors in the background, from a single thread. Each round, every
+        sensor is read (see w1_bus.convert). The latest good reading of each is available
+        instantly from temp_service.get_temp().
+
+        **kwargs:
+            sensors         (list, string)  Serial numbers of the sensors to read. Default is every sensor
+                                            found on the bus.
+            interval        (float)         Time between the start of each round of readings (s). A round
+                                            takes ~750 ms, so this is a minimum. Default is 1.0
+            startnow        (bool)          Start the reading thread straight away. Default is True
+            bus             (w1_bus)        Bus to read the sensors on. Default is a new w1_bus.
+        '''
+        self.interval = interval
+        self.bus = bus if bus is not None else w1_bus()
+        if sensors is None: sensors = self.bus.sernos
+        self.sensors = list()
+        self.readings = dict()  # serno: (temperature, time of reading); replaced whole, so reads need no lock
+        self.failures = dict()  # serno: number of failed (CRC or IO) reads
+        for serno in sensors:
+            self.add_sensor(serno)
+
+        self.running = False
+        self.finished = True
+        if startnow: self.start()
+
+    def add_sensor(self, serno):
+        '''
+        temp_service.add_sensor(serno)
+
+        Adds a sensor to be read, from the next round.
+        '''
+        self.sensors = self.sensors + [ds18b20(serno)]
+        self.failures[serno] = 0
+
+    def start(self):
+        '''
+        temp_service.start()
+
+        Starts the reading thread, if it isn't already running.
+        '''
+        if self.running: return
+        self.running = True
+        self.finished = False
+        td.start_new_thread(self.run, tuple())
+
+    def stop(self, timeout=5.0):
+        '''
+        temp_service.stop(**kwargs)
+
+        Stops the reading thread after the current reading, and closes the sensor files.
+
+        **kwargs:
+            timeout     (float)         Maximum time to wait for the thread to finish (s). Default is 5
+        '''
+        self.running = False
+        end = time.time() + timeout
+        while not self.finished and time.time() < end:
+            time.sleep(0.01)
+
+    def read_all(self):
+        '''
+        temp_service.read_all()
+
+        Reads every sensor once, storing the good readings.
+        '''
+        sensors = self.sensors
+        temps = self.bus.convert(sensors)
+        now = time.time()
+        for sens, temp_c in zip(sensors, temps):
+            if temp_c is None:
+                self.failures[sens.serno] += 1
+            else:
+                self.readings[sens.serno] = (temp_c, now)
+
+    def run(self):
+        '''
+        temp_service.run()
+
+        When temp_service.start() is called, a thread is created running this method. Reads the sensors
+        every interval seconds until temp_service.stop() is called.
+        '''
+        next_round = time.time()
+        while self.running:
+            self.read_all()
+            next_round += self.interval
+            delay = next_round - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_round = time.time()
+        for sens in self.sensors:
+            sens.close()
+        self.finished = True
+
+    def get_temp(self, serno=None, default=None):
+        '''
+        temp_service.get_temp(**kwargs)
+
+        Gets the latest good reading of a sensor, without waiting.
+
+        **kwargs:
+            serno       (string)        Serial number of the sensor. Default is the first sensor.
+            default     (float)         Returned as the temperature if there has been no good reading yet.
+                                        Default is None
+
+        Returns:
+            temp_c      (float)         Temperature (celsius).
+            age         (float)         Time since the reading was taken (s); infinite if there has been
+                                        no good reading.
+        '''
+        if serno is None:
+            if len(self.sensors) == 0: return default, float('inf')
+            serno = self.sensors[0].serno
+        reading = self.readings.get(serno)
+        if reading is None: return default, float('inf')
+        return reading[0], time.time() - reading[1]
+
+    def get_all(self):
+        '''
+        temp_service.get_all()
+
+        Returns:
+            readings    (dict)          serno: (temperature (celsius), time of reading) for every sensor
+                                        read so far.
+        '''
+        return dict(self.readings)
+
+    def get_row(self):
+        '''
+        temp_service.get_row()
+
+        Gets the latest readings of every sensor, in order, for logging.
+
+        Returns:
+            row         (list, float)   Temperature (celsius) and time of reading of each sensor in turn;
+                                        NaN for sensors which haven't been read yet.
+        '''
+        row = list()
+        for sens in self.sensors:
+            row.extend(self.readings.get(sens.serno, (float('nan'), float('nan'))))
+        return row
+
+if __name__ == "__main__":
+    print temp_service.__doc__
@@ -0,0 +1,430 @@
+'''
+    Performance benchmarks.
+
+    One entry point for timing the whole of the rheometer's code, off the Pi:
+
+        startup     Import time of each of the control path modules, in a fresh interpreter, and
+                    a check that none of them pulls in the slow-loading packages used only for
+                    plotting and fitting (pandas, matplotlib, sympy, scipy).
+        adc         MCP3008.read_volts and motor.read_sensors (all channels), against dummyspi.
+        edges       motor.opt_fr (edge callback), motor.process_edges and motor.get_speed.
+        pid         pid_controller.get_control_action calls per second.
+        poll        motor.poll row rate, with the control loop running and a simulated rig
+                    (simhw.py) turning the motor, in real time.
+        processing  dproc.read_logf, dproc.calc_mu and filter.filter on each of the logs in logs/.
+
+    Results can be written out as JSON, and compared against a previous run: rates (keys
+    ending '_per_s') that have fallen, or times (keys ending '_ms') that have risen, by more
+    than the tolerance are reported as regressions. Exits with status 1 if there are any, or
+    if a control module loads a heavy package, so it can be run as a check after changes.
+
+    Usage:
+        python benchmark.py [--only SECTION,...] [--repeat N] [--json FILE] [--compare FILE]
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from timeit import default_timer as timer
+
+root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+bin_dir = os.path.join(root_dir, "bin")
+logs_dir = os.path.join(root_dir, "logs")
+
+control_modules = ["motor", "adc", "control", "dproc", "schedule"]
+heavy_modules = ["pandas", "matplotlib", "sympy", "scipy"]
+sections = ["startup", "adc", "edges", "pid", "poll", "processing"]
+default_filters = ["gaussian", "butterworth", "wiener", "segmented_spline"] # spline takes tens of seconds on the longer logs
+
+import_script = '''
+import sys, time
+t = time.time()
+import {0}
+dt = time.time() - t
+print dt
+print " ".join(sorted(set(m.split(".")[0] for m in sys.modules if sys.modules[m] is not None)))
+'''
+
+def time_import(module, repeat=5):
+    '''
+    time_import(module, **kwargs)
+
+    Imports (module) in a new interpreter, (repeat) times.
+
+    Returns:
+        times       (list, float)       Import time of each repeat (s).
+        loaded      (list, string)      Top level packages loaded by the import.
+    '''
+    times = list()
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", import_script.format(module)], cwd=bin_dir)
+        lines = out.splitlines()
+        times.append(float(lines[0]))
+        loaded = lines[1].split()
+    return times, loaded
+
+def check_startup(repeat=5):
+    '''
+    check_startup(**kwargs)
+
+    Times the import of every control module, and checks for heavy imports.
+
+    Returns:
+        results     (dict)              module: {"min", "median" (s), "heavy" (list of heavy packages loaded)}
+        ok          (bool)              True if no control module loads a heavy package.
+    '''
+    results = dict()
+    ok = True
+    for module in control_modules:
+        times, loaded = time_import(module, repeat)
+        heavy = [h for h in heavy_modules if h in loaded]
+        if heavy: ok = False
+        results[module] = {"min": min(times), "median": sorted(times)[len(times) // 2], "heavy": heavy}
+    return results, ok
+
+def per_second(func, n, repeat=3):
+    '''
+    per_second(func, n, **kwargs)
+
+    Calls func() (n) times, (repeat) times over.
+
+    Returns:
+        rate        (float)             Calls per second, of the fastest repeat.
+    '''
+    best = float('inf')
+    for r in range(repeat):
+        start = timer()
+        for i in xrange(n):
+            func()
+        best = min(best, timer() - start)
+    return n / best
+
+def best_time(func, repeat=3):
+    '''
+    best_time(func, **kwargs)
+
+    Returns:
+        time        (float)             Shortest time taken by func(), over (repeat) calls (ms).
+    '''
+    best = float('inf')
+    for r in range(repeat):
+        start = timer()
+        func()
+        best = min(best, timer() - start)
+    return best * 1000.0
+
+
+class fixed_adc(object):
+    # dummyspi backend: mid scale on every channel, so only adc.py's own work is timed
+    def adc_counts(self, channel):
+        return 512
+
+def close_motor(mot):
+    # motor.clean_exit(), without waiting for the motor to stop (it was never started)
+    import motor
+    mot.pwm_er.stop()
+    mot.aconv.release()
+    mot.temps.stop()
+    motor.gpio.cleanup()
+    mot.gpio_ready = False
+
+def bench_startup(repeat=5):
+    results, ok = check_startup(repeat)
+    out = dict()
+    for module, r in results.items():
+        out[module] = {"min_ms": r["min"] * 1000.0, "median_ms": r["median"] * 1000.0, "heavy": r["heavy"]}
+    return out, ok
+
+def bench_adc(repeat=3, n=20000):
+    '''
+    bench_adc(**kwargs)
+
+    Times single channel and all channel reads of the ADC, through dummyspi.
+    '''
+    import adc
+    import dummyspi
+    dummyspi.backend = fixed_adc()
+    conv = adc.MCP3008(cs_pin=1, persistent=True)
+    conv.bus = dummyspi.SpiDev() # even on the Pi
+    try:
+        return {"read_volts_per_s": per_second(lambda: conv.read_volts(2), n, repeat),
+                "read_sensors_per_s": per_second(conv.read_all_channels, n // 8, repeat)}
+    finally:
+        conv.release()
+        dummyspi.backend = None
+
+def bench_edges(repeat=3, n=20000, batch=8, edge_dt=1e-3):
+    '''
+    bench_edges(**kwargs)
+
+    Times the encoder edge callback, the processing of the recorded edges in batches of (batch) (as the poll
+    and control loops find them), and the speed estimate.
+    '''
+    import numpy as np
+    import motor
+    mot = motor.motor(poll_logging=False)
+    pin = mot.opt_pins[0]
+    try:
+        results = {"opt_fr_per_s": per_second(lambda: mot.opt_fr(pin), n, repeat)}
+        mot.edge_tail = mot.edge_head
+
+        # a full ring buffer of evenly spaced edges, then handed over a batch at a time
+        best = float('inf')
+        length = mot.edge_buf_len - (mot.edge_buf_len % batch)
+        t0 = max(mot.thens) + edge_dt
+        for r in range(repeat):
+            base = mot.edge_head
+            k = np.arange(base, base + length)
+            mot.edge_t[k & mot.edge_mask] = t0 + edge_dt * np.arange(length)
+            mot.edge_pin[k & mot.edge_mask] = pin
+            mot.edge_lvl[k & mot.edge_mask] = k % 2
+            t0 += edge_dt * length
+            start = timer()
+            for head in xrange(base + batch, base + length + 1, batch):
+                mot.edge_head = head
+                mot.process_edges()
+            best = min(best, timer() - start)
+        results["process_edges_per_s"] = length / best
+        results["get_speed_per_s"] = per_second(mot.get_speed, n // 4, repeat)
+        return results
+    finally:
+        close_motor(mot)
+
+def bench_pid(repeat=3, n=100000):
+    '''
+    bench_pid(**kwargs)
+
+    Times the controller, with a measurement moving about the setpoint.
+    '''
+    from control import pid_controller
+    pidc = pid_controller((1.8, 2.845, 0.0), set_point=45.0)
+    values = [40.0, 44.0, 46.0, 50.0]
+    state = [0]
+    def step():
+        state[0] += 1
+        pidc.get_control_action(values[state[0] & 3], dt=0.01)
+    return {"get_control_action_per_s": per_second(step, n, repeat)}
+
+def bench_poll(duration=3.0, interval=1e-4, dc=40.0, shutdown_timeout=15.0):
+    '''
+    bench_poll(**kwargs)
+
+    Runs the polling loop as fast as it can go (every (interval) s, if possible), logging to a temporary binary
+    log, with the control loop running and a simulated rig driven at (dc) % duty, for (duration) s of real time.
+    Raises a RuntimeError if the log writer fails, or hasn't finished (shutdown_timeout) s after the poll stops.
+    '''
+    import motor
+    import simhw
+    sim = simhw.start_rig(speedup=1.0, mu=0.5, seed=0)
+    log_dir = tempfile.mkdtemp()
+    mot = motor.motor(log_interval=interval)
+    try:
+        mot.start_poll(name=os.path.join(log_dir, "benchmark.bin"), controlled=True)
+        mot.update_setpoint(100.0)
+        start = timer()
+        time.sleep(duration)
+        poll_stats = mot.get_poll_stats()
+        control_stats = mot.get_control_stats()
+        elapsed = timer() - start
+        results = {"rows_per_s": poll_stats["iterations"] / elapsed,
+                   "row_latency_ms": poll_stats["latency"]["mean"] * 1000.0,
+                   "control_per_s": control_stats["iterations"] / elapsed,
+                   "control_latency_ms": control_stats["latency"]["mean"] * 1000.0,
+                   "control_latency_max_ms": control_stats["latency"]["max"] * 1000.0,
+                   "control_missed": control_stats["missed"],
+                   "edges": mot.get_edge_stats()["edges"],
+                   "edges_lost": mot.get_edge_stats()["lost"]}
+        results["rows_dropped"] = mot.get_log_stats()["dropped"]
+
+        # the polling thread shuts everything down (motor.clean_exit) when it stops
+        mot.poll_running = False
+        end = time.time() + shutdown_timeout
+        while not mot.logf.finished:
+            if time.time() > end:
+                raise RuntimeError("Log writer did not finish within {} s of stopping the poll: {}".format(
+                    shutdown_timeout, mot.get_log_stats()))
+            time.sleep(0.05)
+        if mot.logf.error is not None:
+            raise RuntimeError("Log writing failed: {}".format(mot.logf.error))
+        return results
+    finally:
+        sim.stop()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+def bench_processing(repeat=3, logs=None, filters=default_filters, fill_volume_ml=15.0):
+    '''
+    bench_processing(**kwargs)
+
+    Times reading each log, calculating its viscosity, filtering its speed with each filter in (filters), and
+    filtering all of its speeds, Vms and Ims at once.
+    '''
+    import numpy as np
+    import dproc
+    import filter as flt
+    if logs is None: logs = sorted(glob.glob(os.path.join(logs_dir, "*.csv")))
+    results = dict()
+    total = dict()
+    for log_n in logs:
+        name = os.path.basename(log_n)
+        try:
+            r = dproc.read_logf(log_n, f0_is_omega_rpm=True, cra_is_Ims_A=True)
+        except Exception as e:
+            results[name] = {"error": "{}: {}".format(type(e).__name__, e)}
+            continue
+        st, omega, Vms, Ims = r[1], r[3], r[12], r[8]
+        res = {"rows": len(st)}
+        res["read_logf_ms"] = best_time(lambda: dproc.read_logf(log_n), repeat)
+        res["calc_mu_ms"] = best_time(lambda: dproc.calc_mu(st, Vms, Ims, fill_volume_ml, omega), repeat)
+        for f in filters:
+            method = flt.ftype[f]
+            res["filter_{}_ms".format(f)] = best_time(lambda: flt.filter(st, r[2], method=method), repeat)
+        cols = np.vstack([r[2:8], Vms, Ims])  # the columns filtered by read_logf(filter_readings=True)
+        res["filter_columns_ms"] = best_time(lambda: flt.filter(st, cols), repeat)
+        for k, v in res.items():
+            total[k] = total.get(k, 0) + v
+        results[name] = res
+    if total.get("read_logf_ms"):
+        total["read_logf_rows_per_s"] = total["rows"] / (total["read_logf_ms"] / 1000.0)
+    results["total"] = total
+    return results
+
+def run(only=sections, repeat=3, duration=3.0, logs=None, filters=default_filters):
+    '''
+    run(**kwargs)
+
+    Runs the benchmarks.
+
+    **kwargs:
+        only        (list, string)      Sections to run. Default is every section (benchmark.sections)
+        repeat      (integer)           Repeats of each timing; the best is kept. Default is 3
+        duration    (float)             Length of the polling benchmark (s). Default is 3
+        logs        (list, string)      Logs for the processing benchmark. Default is every .csv in logs/
+        filters     (list, string)      Filters (filter.ftype names) to time. Default is gaussian, butterworth,
+                                        wiener and segmented_spline
+
+    Returns:
+        results     (dict)              {"meta": (machine, version and time of the run), "results": section:
+                                        results}
+        ok          (bool)              False if a control module loads a heavy package.
+    '''
+    if bin_dir not in sys.path: sys.path.insert(0, bin_dir)
+    results = dict()
+    ok = True
+    for section in only:
+        if section == "startup":
+            results[section], ok = bench_startup(max(repeat, 5))
+        elif section == "adc":
+            results[section] = bench_adc(repeat)
+        elif section == "edges":
+            results[section] = bench_edges(repeat)
+        elif section == "pid":
+            results[section] = bench_pid(repeat)
+        elif section == "poll":
+            results[section] = bench_poll(duration)
+        elif section == "processing":
+            results[section] = bench_processing(repeat, logs, filters)
+        else:
+            raise ValueError("Unknown benchmark section: {}".format(section))
+    return {"meta": run_info(), "results": results}, ok
+
+def run_info():
+    try:
+        commit = subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=root_dir,
+                                         stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "commit": commit, "machine": platform.node(),
+            "platform": platform.platform(), "python": platform.python_version()}
+
+def flatten(results, prefix=""):
+    '''
+    flatten(results)
+
+    Returns:
+        values      (dict)              "section.name...": value, for every number in (nested) results.
+    '''
+    out = dict()
+    for k, v in results.items():
+        if isinstance(v, dict):
+            out.update(flatten(v, prefix + k + "."))
+        elif isinstance(v, (int, long, float)) and not isinstance(v, bool):
+            out[prefix + k] = v
+    return out
+
+def compare(old, new, tolerance=0.2):
+    '''
+    compare(old, new, **kwargs)
+
+    Compares two sets of results (as returned by run, or read from JSON).
+
+    **kwargs:
+        tolerance   (float)             Fractional change allowed before a rate or time counts as a regression.
+                                        Default is 0.2
+
+    Returns:
+        regressions (list)              (key, old value, new value) of every rate that has fallen, or time that has
+                                        risen, by more than the tolerance.
+    '''
+    old, new = flatten(old["results"]), flatten(new["results"])
+    regressions = list()
+    for k in sorted(set(old) & set(new)):
+        if k.endswith("_per_s") and new[k] < old[k] * (1.0 - tolerance):
+            regressions.append((k, old[k], new[k]))
+        elif k.endswith("_ms") and new[k] > old[k] * (1.0 + tolerance):
+            regressions.append((k, old[k], new[k]))
+    return regressions
+
+def print_results(results):
+    values = flatten(results["results"])
+    width = max([len(k) for k in values] + [0]) + 2
+    for k, v in sorted(values.items()):
+        print "{:<{w}}{:>14.3f}".format(k, v, w=width)
+    for k, v in sorted(results["results"].get("processing", dict()).items()):
+        if "error" in v: print "{:<{w}}{}".format("processing." + k, v["error"], w=width)
+    for module, r in sorted(results["results"].get("startup", dict()).items()):
+        if r["heavy"]: print "{:<{w}}loads {}".format("startup." + module, ", ".join(r["heavy"]), w=width)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times acquisition, control and processing.")
+    parser.add_argument("--only", default=",".join(sections),
+                        help="comma separated sections to run (default {})".format(",".join(sections)))
+    parser.add_argument("--repeat", type=int, default=3, help="repeats of each timing, best kept (default 3)")
+    parser.add_argument("--duration", type=float, default=3.0, help="length of the polling benchmark, s (default 3)")
+    parser.add_argument("--logs", nargs="*", help="logs to process (default logs/*.csv)")
+    parser.add_argument("--filters", default=",".join(default_filters),
+                        help="filters to time (default {})".format(",".join(default_filters)))
+    parser.add_argument("--json", help="write the results to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="results of an earlier run (JSON) to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fractional slow down allowed (default 0.2)")
+    args = parser.parse_args()
+
+    results, ok = run(args.only.split(","), args.repeat, args.duration, args.logs, args.filters.split(","))
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    else:
+        print_results(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if not ok:
+        sys.stderr.write("Heavy packages loaded on the control path!\n")
+    regressions = list()
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for k, old, new in regressions:
+            sys.stderr.write("Regression: {} {:.3f} -> {:.3f}\n".format(k, old, new))
+    if not ok or regressions:
+        sys.exit(1)
@@ -6,7 +6,7 @@ import resx
 from time import sleep
 m= motor.motor()
 m.start_poll(name="test.csv", controlled=False)
-m.pidc.tuning = [0.75, 3.0, 0.0]
+m.set_tuning([0.75, 3.0, 0.0])
 m.update_setpoint(150)
 m.set_dc(25)
 print "wait"
@@ -15,7 +15,7 @@ m.start_poll(name="test.csv", controlled=False)
 print "waiting..."
 m.set_dc(30) # approx 100
 sleep(2)
-#m.pidc.tuning = (0.1, 1.0, 0.0)
+#m.set_tuning((0.1, 1.0, 0.0))
 #m.update_setpoint(100.0)
 #m.start_control()
 currents = list()
@@ -0,0 +1,66 @@
+'''
+    Checks livebuf.live_buffer's running statistics against the same statistics worked out
+    directly from the rows in the window, including rows coming in faster than the buffer was
+    sized for (so that rows are overwritten before they leave the window).
+
+    Usage:
+        python tlivebuf.py
+
+    Author: Chris Boyle (christopher.boyle.101@strath.ac.uk)
+'''
+
+# System
+import os
+import sys
+
+# 3rd Party
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+from livebuf import live_buffer
+
+
+def check(buf, rows, tol=1e-9):
+    # rows: every (t, value) pushed so far; the window is what's left after the time cut and the overwrite
+    t_last = rows[-1][0]
+    kept = rows[-buf.length:]
+    window = np.array([v for t, v in kept if t >= t_last - buf.window])
+    st = buf.stats("x")
+    assert st["n"] == len(window), (st["n"], len(window))
+    assert abs(st["mean"] - np.mean(window)) < tol, (st["mean"], np.mean(window))
+    assert abs(st["std"] - np.std(window)) < 1e-6, (st["std"], np.std(window))
+    assert st["min"] == np.min(window), (st["min"], np.min(window))
+    assert st["max"] == np.max(window), (st["max"], np.max(window))
+    times, values = buf.get_span("x")
+    assert len(times) <= buf.length
+
+
+def overflow():
+    # 20 rows at the same time, in a buffer of 8: the window is the last 8 rows
+    buf = live_buffer(fields=["x"], span=1, window=1, rate=4)
+    rows = list()
+    for j in range(20):
+        buf.push(0.0, [float(j)])
+        rows.append((0.0, float(j)))
+        check(buf, rows)
+    assert buf.mean("x") == 15.5, buf.mean("x")
+
+
+def bursts(seed=0):
+    # rows at about the expected rate, with bursts much faster than it
+    rng = np.random.RandomState(seed)
+    buf = live_buffer(fields=["x"], span=1, window=0.5, rate=10)
+    rows = list()
+    t = 0.0
+    for j in range(2000):
+        t += rng.exponential(0.1) if rng.rand() < 0.7 else 0.0
+        x = rng.randn()
+        buf.push(t, [x])
+        rows.append((t, x))
+        check(buf, rows)
+
+
+if __name__ == "__main__":
+    overflow()
+    bursts()
+    print "ok"
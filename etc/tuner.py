@@ -33,7 +33,7 @@ print "control started"
 
 while not finished:
     try:
-        print "tuning: {}".format(m.pidc.tuning)
+        print "tuning: {}".format(m.tuning)
         m.update_setpoint(100)
         print "Setpoint 100"
         for i in range(0, 100):
@@ -55,7 +55,7 @@ while not finished:
         plt.show()
     except:
         pass
-    print "Old Tuning: ", m.pidc.tuning, "\nNew tuning:"
+    print "Old Tuning: ", m.tuning, "\nNew tuning:"
     r = raw_input("Kp: ")
     if len(r) == 0:
         finished = True
@@ -63,5 +63,5 @@ while not finished:
         tun[0] = float(r)
         tun[1] = float(raw_input("Ki: "))
         tun[2] = float(raw_input("Kd: "))
-        m.pidc.tuning = tun
+        m.set_tuning(tun)
 m.clean_exit()
@@ -17,13 +17,13 @@ m.start_control()
 
 Ku = 4
 
-m.pidc.tuning = (Ku, 0.0, 0.0)
-m.pidc.tuning = (1.8, 2.85, 0.0)
+m.set_tuning((Ku, 0.0, 0.0))
+m.set_tuning((1.8, 2.85, 0.0))
 
 errs_ = list()
 times = list()
 
-print "control started\ttuning: {}".format(m.pidc.tuning)
+print "control started\ttuning: {}".format(m.tuning)
 m.update_setpoint(100)
 
 print "waiting"